@@ -7,8 +7,21 @@
 # 95562 Diogo Santos
 
 
+import os
 import sys
+import glob
+import time
+import heapq
+import signal
 import pickle
+import bisect
+import argparse
+import functools
+import multiprocessing
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
 
 from search import Problem, Node, depth_first_tree_search, greedy_search, astar_search
 from utils import manhattan_distance
@@ -18,12 +31,122 @@ class NumbrixState:
 
     def __init__(self, board):
         self.board = board
+        # True se a propagação de restrições mostrou que não há solução
+        self.dead = False
         self.id = NumbrixState.state_id
         NumbrixState.state_id += 1
 
     def __lt__(self, other):
         return self.id < other.id
 
+    def __eq__(self, other):
+        # Dois estados são iguais se os tabuleiros tiverem os mesmos números
+        # nas mesmas posições, qualquer que seja a ordem pela qual foram colocados
+        return (isinstance(other, NumbrixState) and self.board.zobrist_hash == other.board.zobrist_hash
+                and self.board.same_numbers(other.board))
+
+    def __hash__(self):
+        return self.board.zobrist_hash
+
+
+def splitmix64(seed: int) -> int:
+    """ Gerador pseudo-aleatório determinístico de 64 bits, usado para as
+    chaves de Zobrist (assim são iguais em todos os processos). """
+    z = (seed * 0x9E3779B97F4A7C15 + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return z ^ (z >> 31)
+
+class GridTopology:
+    """ Tabelas que só dependem da dimensão do tabuleiro (vizinhos de cada
+    posição e números adjacentes a cada número). São criadas uma vez por
+    dimensão com get_topology e partilhadas por todos os tabuleiros. """
+
+    def __init__(self, dim: int) -> None:
+        self.dim = dim
+
+        # Dicionario que guarda as posições vizinhas de cada posição
+        # {(linha, coluna): [(linha, coluna)]}
+        self.neighbours_positions = {}
+        # Dicionario que guarda os números imediatamente adjacentes a cada número
+        # {número: [número]}
+        self.number_seqs = {}
+        self.create_neighbours_positions()
+        self.create_number_seq()
+
+        # Mesma informação em formato plano (casa = linha*dim+coluna), para o FlatBoard:
+        # coords[casa] é a posição da casa e os vizinhos da casa i são
+        # neighbour_cells[neighbour_offsets[i]:neighbour_offsets[i+1]] (formato CSR)
+        self.coords = [divmod(cell, dim) for cell in range(dim * dim)]
+        self.neighbour_offsets = array('I', [0])
+        self.neighbour_cells = array('H')
+        for row, col in self.coords:
+            for (y, x) in self.neighbours_positions[(row, col)]:
+                self.neighbour_cells.append(y * dim + x)
+            self.neighbour_offsets.append(len(self.neighbour_cells))
+        # Número de vizinhos de cada casa
+        self.degrees = bytes(self.neighbour_offsets[cell + 1] - self.neighbour_offsets[cell]
+                             for cell in range(dim * dim))
+
+        # Máscaras de bits para o BitBoard: bit i = casa i. neighbour_masks[casa]
+        # tem os vizinhos da casa; as de coluna servem para deslocar uma
+        # máscara para a esquerda/direita sem passar de uma linha para a outra
+        self.neighbour_masks = [sum(1 << self.neighbour_cells[i]
+                                    for i in range(self.neighbour_offsets[cell], self.neighbour_offsets[cell + 1]))
+                                for cell in range(dim * dim)]
+        self.full_mask = (1 << (dim * dim)) - 1
+        first_column = sum(1 << (row * dim) for row in range(dim))
+        self.not_first_column = self.full_mask & ~first_column
+        self.not_last_column = self.full_mask & ~(first_column << (dim - 1))
+
+    def __reduce__(self):
+        # Ao copiar um tabuleiro com pickle basta guardar a dimensão
+        return get_topology, (self.dim,)
+
+    def create_neighbours_positions(self) -> None:
+        """ Guarda as posições que estão em redor de cada posição. """
+        for row in range(self.dim):
+            for col in range(self.dim):
+                available_positions = []
+                for y in (col - 1, col + 1):
+                    if 0 <= y < self.dim:
+                        available_positions.append((row, y))
+                for x in (row - 1, row + 1):
+                    if 0 <= x < self.dim:
+                        available_positions.append((x, col))
+                self.neighbours_positions[(row, col)] = available_positions
+
+    def create_number_seq(self) -> None:
+        """ Guarda, para cada número, a lista com os valores imediatamente adjácentes. """
+        for number in range(1, self.dim ** 2 + 1):
+            res = []
+            if number > 1:
+                res.append(number - 1)
+            if number < self.dim ** 2:
+                res.append(number + 1)
+            self.number_seqs[number] = res
+
+
+# Balde MRV dos números em falta sem adjacentes colocados (um número tem no
+# máximo 4 posições candidatas)
+MRV_UNCONSTRAINED = 5
+# Entradas antigas toleradas num balde MRV antes de o compactar
+MRV_COMPACT_SLACK = 8
+
+# Número máximo de dimensões diferentes cujas tabelas ficam em memória
+TOPOLOGY_CACHE_SIZE = 16
+
+# Memória (em MB) usada por omissão pela cache de tabuleiros sem solução
+NOGOOD_CACHE_MB = 64
+NOGOOD_POLICIES = ("lru", "fifo")
+
+
+@functools.lru_cache(maxsize=TOPOLOGY_CACHE_SIZE)
+def get_topology(dim: int) -> GridTopology:
+    """ Devolve a topologia partilhada pelos tabuleiros de dimensão dim. """
+    return GridTopology(dim)
+
+
 class Board:
     """ Representação interna de um tabuleiro de Numbrix. """
 
@@ -39,8 +162,7 @@ class Board:
         # Dicionario que guarda as posições de cada número
         # {número: (linha, coluna)}
         self.positions = {}
-        self.create_number_seq()
-        self.create_neighbours_positions()
+        self.topology = get_topology(dim)
         
         # Lista de posições vazias
         # [(linha, coluna)]
@@ -48,6 +170,7 @@ class Board:
 
         # Objetivo:
         # Encontrar todos os números em falta / Encontrar a posição de todos os números
+        used_numbers = []
         for row in range(dim):
             for col in range(dim):
                 number = board[row][col]
@@ -57,10 +180,294 @@ class Board:
                 # If position is not empty
                 else:
                     self.positions[number] = (row, col)
+                    used_numbers.append(number)
+
+        # Índice de cada posição vazia em empty_pos (-1 se estiver preenchida),
+        # para a retirar em O(1) trocando-a com a última
+        # [[índice]]
+        self.empty_index = [[-1] * dim for _ in range(dim)]
+        for index, (row, col) in enumerate(self.empty_pos):
+            self.empty_index[row][col] = index
+
+        self.init_structures(used_numbers)
+
+    def init_structures(self, used_numbers: list) -> None:
+        """ Cria as estruturas partilhadas por todas as representações a
+        partir dos números colocados. Os construtores chamam-no depois de
+        preencherem positions, empty_pos e empty_index. """
+        self.init_missing_numbers(used_numbers)
+        self.init_candidates()
+        self.init_gaps(used_numbers)
+        self.init_hash()
+
+        # Posições preenchidas desde a última verificação de regiões
+        # (None obriga a verificar o tabuleiro todo)
+        # [(linha, coluna)]
+        self.dirty_positions = None
+
+        # Mapas de distâncias (BFS pelas posições vazias) a partir de cada
+        # número colocado, calculados quando são precisos
+        # {número: (horizonte, {(linha, coluna): distância})}
+        self.distance_maps = {}
 
-        # Lista de números em falta
+        self.init_heuristic()
+
+    def init_heuristic(self) -> None:
+        """ Cria as contagens de vizinhos preenchidos e a heurística. """
+        dim = self.dim
+        # Número de vizinhos preenchidos de cada posição e valor da heurística
+        # (soma dos quadrados destas contagens nas posições vazias), ambos
+        # atualizados incrementalmente no add_number / remove_number
+        # [[contagem]]
+        self.filled_neighbours = [[len(self.get_filled_neighbours_positions(row, col)) for col in range(dim)]
+                                  for row in range(dim)]
+        self.heuristic = sum(self.filled_neighbours[row][col] ** 2 for (row, col) in self.empty_pos)
+
+    def init_missing_numbers(self, used_numbers: list) -> None:
+        """ Cria as estruturas dos números em falta: a ordem de prioridade
+        (fixa) dada por get_number_choice_order, o índice de cada número
+        nessa ordem e um array que diz se o número está em falta. """
+        size = self.dim ** 2
+
+        # Lista de números em falta pela ordem em que devem ser escolhidos
         # [número]
-        self.missing_numbers = self.get_number_choice_order(list(self.positions.keys()))
+        self.number_order = self.get_number_choice_order(used_numbers)
+        # Índice de cada número em number_order
+        self.order_index = array('i', [0] * (size + 2))
+        for index, number in enumerate(self.number_order):
+            self.order_index[number] = index
+        # missing[número] == 1 se o número estiver em falta
+        self.missing = bytearray(size + 2)
+        for number in self.number_order:
+            self.missing[number] = 1
+        self.missing_count = len(self.number_order)
+        # Índice em number_order a partir do qual pode haver números em falta
+        self.first_missing = 0
+
+    def init_candidates(self) -> None:
+        """ Cria o índice de posições candidatas de cada número em falta:
+        a interseção das posições vazias em redor dos números adjacentes
+        (número-1 e número+1) que já estão no tabuleiro. """
+        self.reset_candidates()
+        for number in self.iter_missing_numbers():
+            self.refresh_candidates(number)
+
+    def reset_candidates(self) -> None:
+        """ Cria as estruturas vazias do índice de posições candidatas. """
+        size = self.dim ** 2
+        # Lista indexada pelo número com as posições candidatas
+        # (None se o número não estiver em falta ou não tiver adjacentes colocados)
+        # [[(linha, coluna)]]
+        self.candidates = [None] * (size + 2)
+        # Números em falta com uma única posição candidata
+        self.forced = set()
+        # Números em falta que já não têm nenhuma posição candidata
+        self.blocked = set()
+        # Fila por baldes da escolha dinâmica (MRV), só criada pelo enable_mrv
+        self.mrv_buckets = None
+
+    def enable_mrv(self) -> None:
+        """ Cria a fila por baldes para a escolha dinâmica (MRV), que o
+        set_candidates passa a manter: o balde de cada número em falta é o
+        seu número de candidatas (MRV_UNCONSTRAINED se não tiver adjacentes
+        colocados) e cada balde é uma heap de (índice na ordem de
+        prioridade, número). As entradas antigas só são retiradas quando
+        chegam ao topo ou quando passam a ser mais do que as atuais. """
+        size = self.dim ** 2
+        # [[(índice, número)]]
+        self.mrv_buckets = [[] for _ in range(MRV_UNCONSTRAINED + 1)]
+        # Número de entradas atuais de cada balde
+        self.mrv_sizes = [0] * (MRV_UNCONSTRAINED + 1)
+        # Balde atual de cada número (-1 se não estiver em falta)
+        self.mrv_bucket = array('b', [-1] * (size + 2))
+        for number in self.iter_missing_numbers():
+            self.update_mrv_bucket(number)
+
+    def set_candidates(self, number: int, candidates) -> None:
+        """ Guarda as candidatas do número e atualiza forced, blocked e,
+        com MRV, o seu balde. """
+        self.candidates[number] = candidates
+        self.forced.discard(number)
+        self.blocked.discard(number)
+        if candidates is not None:
+            if len(candidates) == 1:
+                self.forced.add(number)
+            elif len(candidates) == 0:
+                self.blocked.add(number)
+        if self.mrv_buckets is not None:
+            self.update_mrv_bucket(number)
+
+    def update_mrv_bucket(self, number: int) -> None:
+        """ Passa o número para o balde do seu número de candidatas. """
+        candidates = self.candidates[number]
+        if not self.missing[number]:
+            bucket = -1
+        elif candidates is None:
+            bucket = MRV_UNCONSTRAINED
+        else:
+            bucket = len(candidates)
+        previous = self.mrv_bucket[number]
+        if bucket == previous:
+            return
+        self.mrv_bucket[number] = bucket
+        if previous >= 0:
+            self.mrv_sizes[previous] -= 1
+            self.compact_mrv_bucket(previous)
+        if bucket >= 0:
+            self.mrv_sizes[bucket] += 1
+            heapq.heappush(self.mrv_buckets[bucket], (self.order_index[number], number))
+            self.compact_mrv_bucket(bucket)
+
+    def compact_mrv_bucket(self, bucket: int) -> None:
+        """ Reconstrói a heap do balde quando as entradas antigas passam a
+        ser mais do que as atuais. """
+        heap = self.mrv_buckets[bucket]
+        if len(heap) <= 2 * self.mrv_sizes[bucket] + MRV_COMPACT_SLACK:
+            return
+        bucket_of = self.mrv_bucket
+        # Uma lista ordenada é uma heap; o conjunto tira as entradas repetidas
+        self.mrv_buckets[bucket] = sorted({entry for entry in heap if bucket_of[entry[1]] == bucket})
+
+    def most_constrained_number(self) -> int:
+        """ Devolve o número em falta com menos posições candidatas
+        (desempate pela ordem de prioridade), ou None. """
+        bucket_of = self.mrv_bucket
+        for bucket, heap in enumerate(self.mrv_buckets):
+            while heap:
+                number = heap[0][1]
+                if bucket_of[number] == bucket:
+                    return number
+                heapq.heappop(heap)
+        return None
+
+    def refresh_candidates(self, number: int) -> None:
+        """ Recalcula as posições candidatas do número (O(1): no máximo
+        duas vezes quatro vizinhos). """
+        candidates = None
+        if self.missing[number]:
+            max_seq = [x for x in self.topology.number_seqs[number] if not self.missing[x]]
+            if max_seq:
+                candidates = self.get_empty_neighbours_positions(*self.positions[max_seq[0]])
+                if len(max_seq) == 2:
+                    candidates = [pos for pos in candidates if pos in set(self.get_empty_neighbours_positions(*self.positions[max_seq[1]]))]
+        self.set_candidates(number, candidates)
+
+    def update_candidates(self, row: int, col: int, number: int) -> None:
+        """ Atualiza o índice de candidatas depois de a posição ter sido
+        preenchida ou esvaziada: só mudam o próprio número, os seus
+        adjacentes e os adjacentes dos números vizinhos da posição. """
+        affected = {number - 1, number, number + 1}
+        for neighbour_number in self.get_neighbours(row, col):
+            if neighbour_number != 0:
+                affected.add(neighbour_number - 1)
+                affected.add(neighbour_number + 1)
+        size = self.dim ** 2
+        for affected_number in affected:
+            if 1 <= affected_number <= size:
+                self.refresh_candidates(affected_number)
+
+    def init_gaps(self, used_numbers: list) -> None:
+        """ Cria o índice ordenado dos números colocados e conta os
+        intervalos entre números consecutivos que são impossíveis. """
+        # Números colocados, por ordem crescente
+        self.placed = sorted(used_numbers)
+        self.infeasible_gaps = sum(self.gap_infeasible(a, b) for a, b in zip(self.placed, self.placed[1:]))
+
+    def init_hash(self) -> None:
+        """ Calcula o hash de Zobrist do tabuleiro: o XOR das chaves de cada
+        número colocado na sua posição. O add_number e o remove_number
+        mantêm-no com um XOR por jogada. """
+        self.zobrist_hash = 0
+        for number in self.placed:
+            self.toggle_hash(*self.positions[number], number)
+
+    def toggle_hash(self, row: int, col: int, number: int) -> None:
+        """ Junta (ou retira) o número na posição ao hash de Zobrist. A chave
+        do par (casa, número) é calculada na altura, em vez de se guardar
+        uma tabela com dim⁴ entradas. """
+        size = self.dim * self.dim
+        self.zobrist_hash ^= splitmix64((row * self.dim + col) * (size + 1) + number)
+
+    def same_numbers(self, other) -> bool:
+        """ Verifica se os dois tabuleiros têm os mesmos números nas mesmas posições. """
+        return self.board == other.board
+
+    def subproblem_key(self) -> bytes:
+        """ Identifica o que falta resolver: as posições vazias, os números
+        que têm vizinhos vazios (com as suas posições) e os números em
+        falta. Os números rodeados de preenchidos já não restringem o resto
+        do tabuleiro, por isso a sua posição fica de fora e dois tabuleiros
+        que só diferem aí têm a mesma chave. """
+        dim = self.dim
+        degrees = self.topology.degrees
+        interior = dim * dim + 1
+        values = array('H', (number if number == 0 or count < degrees[row * dim + col] else interior
+                             for row, (numbers, counts) in enumerate(zip(self.board, self.filled_neighbours))
+                             for col, (number, count) in enumerate(zip(numbers, counts))))
+        return values.tobytes() + bytes(self.missing)
+
+    def gap_infeasible(self, a: int, b: int) -> bool:
+        """ O tabuleiro é bipartido (números consecutivos alternam a cor da
+        casa), por isso o caminho de a até b, com b - a passos, só existe
+        se a distância de Manhattan não exceder b - a e tiver a mesma
+        paridade. """
+        distance = manhattan_distance(self.positions[a], self.positions[b])
+        gap = b - a
+        return distance > gap or (gap - distance) % 2 != 0
+
+    def add_gap_number(self, number: int) -> None:
+        """ Insere o número colocado no índice de intervalos: o intervalo
+        (a, b) que o continha dá lugar a (a, número) e (número, b). """
+        placed = self.placed
+        index = bisect.bisect_left(placed, number)
+        before = placed[index - 1] if index > 0 else None
+        after = placed[index] if index < len(placed) else None
+        if before is not None and after is not None:
+            self.infeasible_gaps -= self.gap_infeasible(before, after)
+        if before is not None:
+            self.infeasible_gaps += self.gap_infeasible(before, number)
+        if after is not None:
+            self.infeasible_gaps += self.gap_infeasible(number, after)
+        placed.insert(index, number)
+
+    def remove_gap_number(self, number: int) -> None:
+        """ Desfaz o add_gap_number (a posição do número ainda tem de
+        estar em positions). """
+        placed = self.placed
+        index = bisect.bisect_left(placed, number)
+        del placed[index]
+        before = placed[index - 1] if index > 0 else None
+        after = placed[index] if index < len(placed) else None
+        if before is not None:
+            self.infeasible_gaps -= self.gap_infeasible(before, number)
+        if after is not None:
+            self.infeasible_gaps -= self.gap_infeasible(number, after)
+        if before is not None and after is not None:
+            self.infeasible_gaps += self.gap_infeasible(before, after)
+
+    @property
+    def missing_numbers(self) -> list:
+        """ Devolve os números em falta, por ordem de prioridade. """
+        return list(self.iter_missing_numbers())
+
+    def iter_missing_numbers(self):
+        """ Percorre os números em falta, por ordem de prioridade. """
+        missing = self.missing
+        order = self.number_order
+        for index in range(self.first_missing, len(order)):
+            if missing[order[index]]:
+                yield order[index]
+
+    def first_missing_number(self) -> int:
+        """ Devolve o primeiro número em falta (ou None), avançando o
+        início da procura sobre os que entretanto foram colocados. """
+        missing = self.missing
+        order = self.number_order
+        index = self.first_missing
+        while index < len(order) and not missing[order[index]]:
+            index += 1
+        self.first_missing = index
+        return order[index] if index < len(order) else None
 
     def get_number_choice_order(self, used_numbers):
         """ Encontra o melhor número em falta para colocar no board. """
@@ -87,29 +494,6 @@ class Board:
                 first += list(range(number + 1, number + worse_used_numbers_dict[number]))
         return first + next + final
 
-    def create_neighbours_positions(self) -> list:
-        """ Devolve as posições que estão em redor da respetiva posição. """
-        for row in range(self.dim):
-            for col in range(self.dim):
-                available_positions = []
-                for y in (col - 1, col + 1):
-                    if 0 <= y < self.dim:
-                        available_positions.append((row, y))
-                for x in (row - 1, row + 1):
-                    if 0 <= x < self.dim:
-                        available_positions.append((x, col))
-                neighbours_positions[(row, col)] = available_positions
-
-    def create_number_seq(self):
-        """ Devolve uma lista com todos os valores imediatamente adjácentes ao número. """
-        for number in range(1, self.dim ** 2 + 1):
-            res = []
-            if number > 1:
-                res.append(number - 1)
-            if number < self.dim ** 2:
-                res.append(number + 1)
-            number_seqs[number] = res
-        
     def adjacent_vertical_numbers(self, row: int, col: int) -> (int, int):
         """ Devolve os valores imediatamente abaixo e acima, 
         respectivamente. """
@@ -137,43 +521,357 @@ class Board:
     def get_number(self, row: int, col: int) -> int:
         return self.board[row][col]
 
+    def get_neighbours_positions(self, row: int, col: int) -> list:
+        """ Devolve as posições que estão em redor da respetiva posição. """
+        return self.topology.neighbours_positions[(row, col)]
+
     def get_neighbours(self, row: int, col: int):
         """ Devolve os valores vizinhos da respetiva posição. """
-        return [self.get_number(y, x) for (y, x) in neighbours_positions[(row, col)]]
+        return [self.get_number(y, x) for (y, x) in self.topology.neighbours_positions[(row, col)]]
         
     def get_empty_neighbours_positions(self, row: int, col: int) -> list:
         """ Devolve as posições que estão por preencher em redor
         da respetiva posição. """
-        return [(y, x) for (y, x) in neighbours_positions[(row, col)] if self.get_number(y, x) == 0]
+        return [(y, x) for (y, x) in self.topology.neighbours_positions[(row, col)] if self.get_number(y, x) == 0]
 
     def get_filled_neighbours_positions(self, row: int, col: int) -> list:
         """ Devolve as posições que estão preenchidas em redor
         da respetiva posição. """
-        return [(y, x) for (y, x) in neighbours_positions[(row, col)] if self.get_number(y, x) != 0]
+        return [(y, x) for (y, x) in self.topology.neighbours_positions[(row, col)] if self.get_number(y, x) != 0]
+
+    def count_empty_neighbours(self, row: int, col: int) -> int:
+        """ Devolve o número de posições por preencher em redor da
+        respetiva posição, sem construir a lista. """
+        return sum(1 for (y, x) in self.topology.neighbours_positions[(row, col)] if self.get_number(y, x) == 0)
+
+    def filled_neighbour_count(self, row: int, col: int) -> int:
+        """ Devolve a contagem (mantida) de vizinhos preenchidos da posição. """
+        return self.filled_neighbours[row][col]
+
+    def heuristic_delta(self, row: int, col: int) -> int:
+        """ Devolve quanto a heurística muda se a posição vazia for
+        preenchida, a partir das contagens de vizinhos preenchidos. """
+        own = self.filled_neighbour_count(row, col)
+        delta = -own * own
+        for (y, x) in self.get_empty_neighbours_positions(row, col):
+            delta += 2 * self.filled_neighbour_count(y, x) + 1
+        return delta
+
+    def constraint_impact(self, number: int, row: int, col: int) -> int:
+        """ Devolve quantos outros números em falta têm a posição como
+        candidata (e a perdem se o número for lá colocado). """
+        impact = 0
+        for value in self.get_neighbours(row, col):
+            if value == 0:
+                continue
+            for other in self.topology.number_seqs[value]:
+                if other != number and self.missing[other]:
+                    candidates = self.candidates[other]
+                    if candidates is not None and (row, col) in candidates:
+                        impact += 1
+        return impact
 
     def add_number(self, row: int, col: int, number: int) -> None:
         """ Atualiza o valor na respetiva posição do tabuleiro."""
         self.board[row][col] = number
         self.positions[number] = (row, col)
-        self.empty_pos.remove((row, col))
+        self.add_gap_number(number)
+        self.toggle_hash(row, col, number)
+        self.remove_empty_position(row, col)
+        self.update_filled_neighbours(row, col, 1)
+        self.remove_missing_number(number)
+        self.update_candidates(row, col, number)
+        self.invalidate_distance_maps(row, col, number, True)
+        if self.dirty_positions is not None:
+            self.dirty_positions.append((row, col))
+
+    def remove_number(self, row: int, col: int, number: int) -> None:
+        """ Desfaz o add_number da respetiva posição do tabuleiro.
+        A ordem de empty_pos não é relevante, por isso basta voltar a
+        acrescentar a posição no fim. """
+        self.board[row][col] = 0
+        self.remove_gap_number(number)
+        self.toggle_hash(row, col, number)
+        del self.positions[number]
+        self.add_empty_position(row, col)
+        self.update_filled_neighbours(row, col, -1)
+        self.restore_missing_number(number)
+        self.update_candidates(row, col, number)
+        self.invalidate_distance_maps(row, col, number, False)
+        self.dirty_positions = None
+
+    def remove_empty_position(self, row: int, col: int) -> None:
+        """ Retira a posição de empty_pos em O(1), pondo a última no seu lugar. """
+        index = self.empty_index[row][col]
+        last = self.empty_pos.pop()
+        if last != (row, col):
+            self.empty_pos[index] = last
+            self.empty_index[last[0]][last[1]] = index
+        self.empty_index[row][col] = -1
+
+    def add_empty_position(self, row: int, col: int) -> None:
+        self.empty_index[row][col] = len(self.empty_pos)
+        self.empty_pos.append((row, col))
+
+    def update_filled_neighbours(self, row: int, col: int, delta: int) -> None:
+        """ Atualiza as contagens de vizinhos preenchidos em redor da posição
+        que foi preenchida (delta=1) ou esvaziada (delta=-1), e a heurística.
+        Só mudam a própria posição e os seus (no máximo 4) vizinhos. """
+        counts = self.filled_neighbours
+        own = counts[row][col]
+        # A posição deixa de contar (ou volta a contar) para a heurística
+        self.heuristic -= delta * own * own
+        for (y, x) in self.get_neighbours_positions(row, col):
+            count = counts[y][x]
+            counts[y][x] = count + delta
+            if self.get_number(y, x) == 0:
+                # (c + delta)^2 - c^2
+                self.heuristic += delta * (2 * count + delta)
+
+    def remove_missing_number(self, number: int) -> None:
+        """ Marca o número como já não estando em falta. """
+        self.missing[number] = 0
+        self.missing_count -= 1
+
+    def restore_missing_number(self, number: int) -> None:
+        """ Volta a marcar o número como em falta, mantendo a sua
+        posição na ordem de prioridade. """
+        self.missing[number] = 1
+        self.missing_count += 1
+        self.first_missing = min(self.first_missing, self.order_index[number])
     
+    def region_supply(self, borders: set) -> int:
+        """ Devolve quantos números em falta podem ocupar uma região vazia
+        cujos vizinhos preenchidos são borders: a soma dos intervalos de
+        números em falta entre dois números consecutivos que estão ambos
+        em borders (ou antes do primeiro / depois do último colocado). """
+        placed = self.placed
+        size = self.dim ** 2
+        supply = 0
+        if placed and placed[0] in borders:
+            supply += placed[0] - 1
+        for number in borders:
+            index = bisect.bisect_right(placed, number)
+            if index == len(placed):
+                supply += size - number
+            elif placed[index] in borders:
+                supply += placed[index] - number - 1
+        return supply
+
+    def dirty_anchors(self) -> set:
+        """ Devolve as posições preenchidas desde a última verificação de
+        regiões e as dos números colocados imediatamente antes e depois de
+        cada uma: o intervalo entre esses dois números foi partido, por
+        isso as regiões à volta deles (mesmo longe da jogada) podem ter
+        perdido capacidade. """
+        placed = self.placed
+        anchors = set()
+        for (row, col) in self.dirty_positions:
+            anchors.add((row, col))
+            index = bisect.bisect_left(placed, self.get_number(row, col))
+            if index > 0:
+                anchors.add(self.positions[placed[index - 1]])
+            if index + 1 < len(placed):
+                anchors.add(self.positions[placed[index + 1]])
+        return anchors
+
+    def regions_feasible(self) -> bool:
+        """ Verifica as regiões de posições vazias vizinhas das posições do
+        dirty_anchors (ou todas, depois de um remove_number): cada região só
+        pode ser preenchida por sequências de números em falta que comecem e
+        acabem nos números colocados à sua volta, por isso não pode ter mais
+        posições do que esses números. """
+        if not self.placed:
+            return True
+        if self.dirty_positions is None:
+            starts = self.empty_pos
+        else:
+            starts = [pos for (row, col) in self.dirty_anchors()
+                      for pos in self.get_empty_neighbours_positions(row, col)]
+        self.dirty_positions = []
+
+        visited = set()
+        for start in starts:
+            if start in visited:
+                continue
+            visited.add(start)
+            stack = [start]
+            size = 0
+            borders = set()
+            while stack:
+                position = stack.pop()
+                size += 1
+                for neighbour in self.get_neighbours_positions(*position):
+                    number = self.get_number(*neighbour)
+                    if number != 0:
+                        borders.add(number)
+                    elif neighbour not in visited:
+                        visited.add(neighbour)
+                        stack.append(neighbour)
+            if size > self.region_supply(borders):
+                return False
+        return True
+
+    def distance_map(self, number: int, horizon: int) -> dict:
+        """ Devolve as distâncias, andando só por posições vazias, da posição
+        do número colocado a cada posição a que se chega em até horizon
+        passos. Os mapas ficam guardados em distance_maps. """
+        cached = self.distance_maps.get(number)
+        if cached is not None and cached[0] >= horizon:
+            return cached[1]
+        start = self.positions[number]
+        distances = {start: 0}
+        frontier = [start]
+        distance = 0
+        while frontier and distance < horizon:
+            distance += 1
+            next_frontier = []
+            for position in frontier:
+                for neighbour in self.get_neighbours_positions(*position):
+                    if neighbour not in distances and self.get_number(*neighbour) == 0:
+                        distances[neighbour] = distance
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+        self.distance_maps[number] = (horizon, distances)
+        return distances
+
+    def invalidate_distance_maps(self, row: int, col: int, number: int, filled: bool) -> None:
+        """ Esquece os mapas de distâncias que a jogada pode ter alterado.
+        Preencher uma posição só aumenta distâncias, por isso basta esquecer
+        os mapas que passavam por ela; esvaziá-la pode encurtá-las para os
+        mapas que chegavam a um dos seus vizinhos. """
+        maps = self.distance_maps
+        if not maps:
+            return
+        if filled:
+            touched = [(row, col)]
+        else:
+            maps.pop(number, None)
+            touched = self.get_neighbours_positions(row, col)
+        for anchor in [anchor for anchor, (_, distances) in maps.items()
+                       if any(position in distances for position in touched)]:
+            del maps[anchor]
+
+    def compute_domains(self) -> dict:
+        """ Devolve as posições possíveis de cada número em falta k, entre os
+        números colocados a < k < b mais próximos: as posições vazias a uma
+        distância (pelas posições vazias) de a no máximo k - a, e de b no
+        máximo b - k, com a mesma paridade. Os números sem nenhuma posição
+        não aparecem no dicionário. {número: [(linha, coluna)]} """
+        placed = self.placed
+        size = self.dim ** 2
+        domains = {}
+        if not placed:
+            return {number: list(self.empty_pos) for number in self.iter_missing_numbers()}
+
+        # Números antes do primeiro colocado: k = b - d, b - d - 2, ..., >= 1
+        first = placed[0]
+        if first > 1:
+            for position, distance in self.distance_map(first, first - 1).items():
+                if distance:
+                    for number in range(first - distance, 0, -2):
+                        domains.setdefault(number, []).append(position)
+
+        # Números entre dois colocados: k entre a + da e b - db, de 2 em 2
+        for a, b in zip(placed, placed[1:]):
+            if b - a < 2:
+                continue
+            after_a = self.distance_map(a, b - a)
+            before_b = self.distance_map(b, b - a)
+            for position, distance in after_a.items():
+                if distance and position in before_b:
+                    for number in range(a + distance, b - before_b[position] + 1, 2):
+                        domains.setdefault(number, []).append(position)
+
+        # Números depois do último colocado: k = a + d, a + d + 2, ..., <= dim²
+        last = placed[-1]
+        if last < size:
+            for position, distance in self.distance_map(last, size - last).items():
+                if distance:
+                    for number in range(last + distance, size + 1, 2):
+                        domains.setdefault(number, []).append(position)
+        return domains
+
+    def admissible_numbers(self, row: int, col: int):
+        """ Devolve os números que ainda podem ocupar a posição vazia, se
+        esta tiver no máximo um vizinho vazio (senão devolve None). Um
+        número k só cabe se os seus adjacentes (k-1 e k+1) que não estão
+        nos vizinhos estiverem em falta e couberem nos vizinhos vazios. """
+        empty = self.count_empty_neighbours(row, col)
+        if empty > 1:
+            return None
+        size = self.dim ** 2
+        values = set(number for number in self.get_neighbours(row, col) if number != 0)
+        numbers = {1, size}
+        for value in values:
+            numbers.add(value - 1)
+            numbers.add(value + 1)
+        admissible = []
+        for number in numbers:
+            if 1 <= number <= size and self.missing[number]:
+                outside = [x for x in self.topology.number_seqs[number] if x not in values]
+                if len(outside) <= empty and all(self.missing[x] for x in outside):
+                    admissible.append(number)
+        return admissible
+
+    def propagate(self, moves: list) -> bool:
+        """ Propagação de restrições depois das jogadas em moves (já feitas
+        no tabuleiro; se moves estiver vazio analisa o tabuleiro todo):
+        enquanto for possível, coloca os números com uma só posição
+        candidata e preenche as posições que só admitem um número. As
+        jogadas feitas são acrescentadas a moves para poderem ser
+        desfeitas. Devolve False se o tabuleiro ficar sem solução. """
+        if moves:
+            pending = set()
+            for (row, col, _) in moves:
+                pending.update(self.get_empty_neighbours_positions(row, col))
+        else:
+            pending = set(self.empty_pos)
+
+        while True:
+            if self.blocked or self.infeasible_gaps:
+                return False
+            if self.forced:
+                number = min(self.forced, key=self.order_index.__getitem__)
+                position = self.candidates[number][0]
+            elif pending:
+                position = pending.pop()
+                if self.get_number(*position) != 0:
+                    continue
+                numbers = self.admissible_numbers(*position)
+                if numbers is None:
+                    continue
+                if len(numbers) != 1:
+                    if not numbers:
+                        return False
+                    continue
+                number = numbers[0]
+            else:
+                return True
+
+            if not self.locked_condition(number, position):
+                return False
+            self.add_number(*position, number)
+            moves.append((*position, number))
+            pending.update(self.get_empty_neighbours_positions(*position))
+
     def locked_condition(self, number, position) -> bool:
         """ Verifica que os vizinhos do número não ficam presos invalidamente
         p.ex 1   2   3 , 7 estaria bloqueado
              4   7   9                                                   """
-        for (row, col) in neighbours_positions[position]:
+        for (row, col) in self.get_neighbours_positions(*position):
             neighbour_number = self.get_number(row, col)
-            if len(self.get_empty_neighbours_positions(row, col)) == 1:
+            if self.count_empty_neighbours(row, col) == 1:
                 if neighbour_number != 0:                
-                    for number_seq in number_seqs[neighbour_number] + [number]:
-                        if number_seq in self.missing_numbers:
+                    for number_seq in self.topology.number_seqs[neighbour_number]:
+                        if number_seq != number and self.missing[number_seq]:
                             return False
                 else:
                     neighbour_neighbours = sorted(self.get_neighbours(row, col) + [0, number, self.dim**2 + 1])
                     has_seq = False
                     for i in range(len(neighbour_neighbours)-1):
                         number_neighbour = neighbour_neighbours[i]
-                        if neighbour_neighbours[i+1] - number_neighbour == 2 and number_neighbour+1 in self.missing_numbers:
+                        if neighbour_neighbours[i+1] - number_neighbour == 2 and self.missing[number_neighbour+1]:
                             has_seq = True
                             break
                     if not has_seq:
@@ -186,10 +884,10 @@ class Board:
         for row in self.board:
             print("\t".join(str(number) for number in row))
 
-    @staticmethod
-    def parse_instance(filename: str):
+    @classmethod
+    def parse_instance(cls, filename: str):
         """ Lê o ficheiro cujo caminho é passado como argumento e retorna
-        uma instância da classe Board. """
+        uma instância da classe Board (ou da subclasse usada). """
         with open(filename, "r") as f:
             lines = f.readlines()
             dim = int(lines[0])
@@ -200,52 +898,539 @@ class Board:
                 line = line.strip().split("\t")
                 assert len(line) == dim
                 board.append([int(x) for x in line])
-        return Board(board, dim)
+        return cls(board, dim)
+
+
+class FlatBoard(Board):
+    """ Variante compacta do Board: o tabuleiro é guardado num único array
+    plano indexado por linha*dim+coluna, os vizinhos de cada casa numa
+    tabela de adjacência em formato CSR e as posições num array indexado
+    pelo número. Mantém a API usada pelo Numbrix. """
+
+    def __init__(self, board: list, dim: int) -> None:
+        self.dim = dim
+        size = dim * dim
+        cells = [number for row in board for number in row]
+        # Enquanto todos os números couberem num byte basta um bytearray
+        self.cells = bytearray(cells) if size < 256 else array('H', cells)
+        self.topology = get_topology(dim)
+        self.coords = self.topology.coords
+        self.neighbour_offsets = self.topology.neighbour_offsets
+        self.neighbour_cells = self.topology.neighbour_cells
+
+        # Lista indexada pelo número com a respetiva posição (None se estiver em falta)
+        # [(linha, coluna)]
+        self.positions = [None] * (size + 2)
+        self.empty_pos = []
+        used_numbers = []
+        for cell, number in enumerate(self.cells):
+            if number == 0:
+                self.empty_pos.append(self.coords[cell])
+            else:
+                self.positions[number] = self.coords[cell]
+                used_numbers.append(number)
+
+        # Índice de cada casa vazia em empty_pos (-1 se estiver preenchida)
+        self.empty_index = array('i', [-1] * size)
+        for index, (row, col) in enumerate(self.empty_pos):
+            self.empty_index[row * dim + col] = index
+
+        self.init_structures(used_numbers)
+
+    def init_heuristic(self) -> None:
+        size = self.dim * self.dim
+        # Número de vizinhos preenchidos de cada casa e valor da heurística
+        self.filled_neighbours = bytearray(self.count_filled_neighbours(cell) for cell in range(size))
+        self.heuristic = sum(self.filled_neighbours[cell] ** 2 for cell in range(size) if self.cells[cell] == 0)
+
+    def same_numbers(self, other) -> bool:
+        if isinstance(other, FlatBoard):
+            return self.cells == other.cells
+        return super().same_numbers(other)
+
+    def subproblem_key(self) -> bytes:
+        interior = self.dim * self.dim + 1
+        values = array('H', (number if number == 0 or count < degree else interior
+                             for number, count, degree in zip(self.cells, self.filled_neighbours, self.topology.degrees)))
+        return values.tobytes() + bytes(self.missing)
+
+    def filled_neighbour_count(self, row: int, col: int) -> int:
+        return self.filled_neighbours[row * self.dim + col]
+
+    def count_filled_neighbours(self, cell: int) -> int:
+        """ Devolve o número de casas preenchidas em redor da casa. """
+        cells = self.cells
+        neighbour_cells = self.neighbour_cells
+        return sum(1 for i in range(self.neighbour_offsets[cell], self.neighbour_offsets[cell + 1])
+                   if cells[neighbour_cells[i]] != 0)
+
+    def __getstate__(self):
+        # As tabelas são partilhadas, não vale a pena copiá-las com o estado
+        state = self.__dict__.copy()
+        del state["coords"], state["neighbour_offsets"], state["neighbour_cells"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.coords = self.topology.coords
+        self.neighbour_offsets = self.topology.neighbour_offsets
+        self.neighbour_cells = self.topology.neighbour_cells
+
+    @property
+    def board(self) -> list:
+        """ Devolve o tabuleiro como lista de linhas. """
+        dim = self.dim
+        return [list(self.cells[row * dim:(row + 1) * dim]) for row in range(dim)]
+
+    def get_number(self, row: int, col: int) -> int:
+        return self.cells[row * self.dim + col]
+
+    def get_neighbours_positions(self, row: int, col: int) -> list:
+        """ Devolve as posições que estão em redor da respetiva posição. """
+        cell = row * self.dim + col
+        coords = self.coords
+        neighbour_cells = self.neighbour_cells
+        return [coords[neighbour_cells[i]] for i in range(self.neighbour_offsets[cell], self.neighbour_offsets[cell + 1])]
+
+    def get_neighbours(self, row: int, col: int):
+        """ Devolve os valores vizinhos da respetiva posição. """
+        cell = row * self.dim + col
+        cells = self.cells
+        neighbour_cells = self.neighbour_cells
+        return [cells[neighbour_cells[i]] for i in range(self.neighbour_offsets[cell], self.neighbour_offsets[cell + 1])]
+
+    def get_empty_neighbours_positions(self, row: int, col: int) -> list:
+        """ Devolve as posições que estão por preencher em redor
+        da respetiva posição. """
+        cell = row * self.dim + col
+        cells = self.cells
+        coords = self.coords
+        neighbour_cells = self.neighbour_cells
+        return [coords[n] for n in (neighbour_cells[i] for i in range(self.neighbour_offsets[cell], self.neighbour_offsets[cell + 1]))
+                if cells[n] == 0]
+
+    def get_filled_neighbours_positions(self, row: int, col: int) -> list:
+        """ Devolve as posições que estão preenchidas em redor
+        da respetiva posição. """
+        cell = row * self.dim + col
+        cells = self.cells
+        coords = self.coords
+        neighbour_cells = self.neighbour_cells
+        return [coords[n] for n in (neighbour_cells[i] for i in range(self.neighbour_offsets[cell], self.neighbour_offsets[cell + 1]))
+                if cells[n] != 0]
+
+    def count_empty_neighbours(self, row: int, col: int) -> int:
+        """ Devolve o número de posições por preencher em redor da
+        respetiva posição, sem construir a lista. """
+        cell = row * self.dim + col
+        cells = self.cells
+        neighbour_cells = self.neighbour_cells
+        total = 0
+        for i in range(self.neighbour_offsets[cell], self.neighbour_offsets[cell + 1]):
+            if cells[neighbour_cells[i]] == 0:
+                total += 1
+        return total
+
+    def add_number(self, row: int, col: int, number: int) -> None:
+        """ Atualiza o valor na respetiva posição do tabuleiro."""
+        cell = row * self.dim + col
+        self.cells[cell] = number
+        self.positions[number] = self.coords[cell]
+        self.add_gap_number(number)
+        self.toggle_hash(row, col, number)
+        self.remove_empty_cell(cell)
+        self.update_filled_neighbours(cell, 1)
+        self.remove_missing_number(number)
+        self.update_candidates(row, col, number)
+        self.invalidate_distance_maps(row, col, number, True)
+        if self.dirty_positions is not None:
+            self.dirty_positions.append((row, col))
+
+    def remove_number(self, row: int, col: int, number: int) -> None:
+        """ Desfaz o add_number da respetiva posição do tabuleiro. """
+        cell = row * self.dim + col
+        self.cells[cell] = 0
+        self.remove_gap_number(number)
+        self.toggle_hash(row, col, number)
+        self.positions[number] = None
+        self.empty_index[cell] = len(self.empty_pos)
+        self.empty_pos.append(self.coords[cell])
+        self.update_filled_neighbours(cell, -1)
+        self.restore_missing_number(number)
+        self.update_candidates(row, col, number)
+        self.invalidate_distance_maps(row, col, number, False)
+        self.dirty_positions = None
+
+    def remove_empty_cell(self, cell: int) -> None:
+        """ Retira a casa de empty_pos em O(1), pondo a última no seu lugar. """
+        index = self.empty_index[cell]
+        last = self.empty_pos.pop()
+        if index < len(self.empty_pos):
+            self.empty_pos[index] = last
+            self.empty_index[last[0] * self.dim + last[1]] = index
+        self.empty_index[cell] = -1
+
+    def update_filled_neighbours(self, cell: int, delta: int) -> None:
+        """ Atualiza as contagens de vizinhos preenchidos em redor da casa
+        que foi preenchida (delta=1) ou esvaziada (delta=-1), e a heurística. """
+        counts = self.filled_neighbours
+        cells = self.cells
+        neighbour_cells = self.neighbour_cells
+        own = counts[cell]
+        self.heuristic -= delta * own * own
+        for i in range(self.neighbour_offsets[cell], self.neighbour_offsets[cell + 1]):
+            neighbour = neighbour_cells[i]
+            count = counts[neighbour]
+            counts[neighbour] = count + delta
+            if cells[neighbour] == 0:
+                self.heuristic += delta * (2 * count + delta)
+
+    def print_board(self):
+        """ Imprime o tabuleiro na consola. """
+        dim = self.dim
+        for row in range(dim):
+            print("\t".join(str(number) for number in self.cells[row * dim:(row + 1) * dim]))
+
+
+class BitBoard(FlatBoard):
+    """ Variante do FlatBoard em que as posições vazias são também um
+    inteiro (bit i = casa i vazia). Os vizinhos vazios de uma casa, a
+    interseção dos candidatos de um número e as regiões vazias passam a ser
+    operações de bits (&, bit_count e extração do bit mais baixo) com as
+    máscaras pré-calculadas no GridTopology. """
+
+    def __init__(self, board: list, dim: int) -> None:
+        # O FlatBoard já usa get_empty_neighbours_positions ao calcular os
+        # candidatos, por isso a máscara tem de existir antes
+        self.empty_mask = sum(1 << cell for cell, number in enumerate(number for row in board for number in row)
+                              if number == 0)
+        super().__init__(board, dim)
+
+    def mask_positions(self, mask: int, cell: int) -> list:
+        """ Devolve as posições dos bits da máscara, que só pode ter vizinhos
+        da casa, pela ordem da tabela de vizinhos (a mesma dos outros
+        tabuleiros, para a procura visitar os filhos pela mesma ordem). """
+        coords = self.coords
+        neighbour_cells = self.neighbour_cells
+        return [coords[n] for n in (neighbour_cells[i] for i in range(self.neighbour_offsets[cell], self.neighbour_offsets[cell + 1]))
+                if mask >> n & 1]
+
+    def dilate(self, mask: int) -> int:
+        """ Devolve as casas vizinhas de alguma casa da máscara. """
+        dim = self.dim
+        topology = self.topology
+        return (((mask << 1) & topology.not_first_column) | ((mask >> 1) & topology.not_last_column)
+                | ((mask << dim) & topology.full_mask) | (mask >> dim))
+
+    def empty_neighbours_mask(self, row: int, col: int) -> int:
+        return self.topology.neighbour_masks[row * self.dim + col] & self.empty_mask
+
+    def get_empty_neighbours_positions(self, row: int, col: int) -> list:
+        """ Devolve as posições que estão por preencher em redor
+        da respetiva posição. """
+        return self.mask_positions(self.empty_neighbours_mask(row, col), row * self.dim + col)
+
+    def count_empty_neighbours(self, row: int, col: int) -> int:
+        """ Devolve o número de posições por preencher em redor da
+        respetiva posição. """
+        return self.empty_neighbours_mask(row, col).bit_count()
+
+    def refresh_candidates(self, number: int) -> None:
+        """ Recalcula as posições candidatas do número com a interseção das
+        máscaras de vizinhos vazios dos adjacentes já colocados. """
+        candidates = None
+        if self.missing[number]:
+            neighbour_masks = self.topology.neighbour_masks
+            mask = first = None
+            for adjacent in self.topology.number_seqs[number]:
+                if not self.missing[adjacent]:
+                    row, col = self.positions[adjacent]
+                    cell = row * self.dim + col
+                    if mask is None:
+                        mask, first = neighbour_masks[cell] & self.empty_mask, cell
+                    else:
+                        mask &= neighbour_masks[cell]
+            if mask is not None:
+                candidates = self.mask_positions(mask, first)
+        self.set_candidates(number, candidates)
+
+    def add_number(self, row: int, col: int, number: int) -> None:
+        self.empty_mask &= ~(1 << (row * self.dim + col))
+        super().add_number(row, col, number)
+
+    def remove_number(self, row: int, col: int, number: int) -> None:
+        self.empty_mask |= 1 << (row * self.dim + col)
+        super().remove_number(row, col, number)
+
+    def regions_feasible(self) -> bool:
+        """ Igual ao Board.regions_feasible, mas cada região é obtida
+        dilatando a máscara de uma casa dentro das casas vazias. """
+        if not self.placed:
+            return True
+        empty = self.empty_mask
+        if self.dirty_positions is None:
+            remaining = empty
+        else:
+            remaining = 0
+            for (row, col) in self.dirty_anchors():
+                remaining |= self.topology.neighbour_masks[row * self.dim + col]
+            remaining &= empty
+        self.dirty_positions = []
+
+        cells = self.cells
+        while remaining:
+            region = remaining & -remaining
+            while True:
+                grown = (region | self.dilate(region)) & empty
+                if grown == region:
+                    break
+                region = grown
+            remaining &= ~region
+            border = self.dilate(region) & ~empty
+            borders = set()
+            while border:
+                low = border & -border
+                borders.add(cells[low.bit_length() - 1])
+                border ^= low
+            if region.bit_count() > self.region_supply(borders):
+                return False
+        return True
+
+
+class NumpyBoard(Board):
+    """ Variante do Board que constrói o tabuleiro inicial com o NumPy: os
+    cálculos sobre o tabuleiro todo (contagens de vizinhos preenchidos,
+    heurística e candidatos de todos os números em falta) são feitos com
+    operações sobre arrays, que compensam nos tabuleiros grandes (30x30 ou
+    mais). As jogadas continuam a usar as listas do Board (aceder a um
+    elemento de um array é mais lento) e mantêm estes valores
+    incrementalmente, por isso os arrays não são guardados. """
+
+    # Deslocamentos dos vizinhos, pela ordem do GridTopology
+    DIRECTIONS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+
+    def empty_mask(self):
+        """ Devolve a máscara booleana das posições vazias. """
+        return np.array(self.board, dtype=np.int16) == 0
+
+    def filled_neighbour_counts(self, empty):
+        """ Devolve o array com o número de vizinhos preenchidos de cada
+        posição, somando a máscara das preenchidas deslocada nas quatro
+        direções. """
+        filled = (~empty).astype(np.int16)
+        counts = np.zeros_like(filled)
+        counts[1:, :] += filled[:-1, :]
+        counts[:-1, :] += filled[1:, :]
+        counts[:, 1:] += filled[:, :-1]
+        counts[:, :-1] += filled[:, 1:]
+        return counts
+
+    def init_heuristic(self) -> None:
+        empty = self.empty_mask()
+        counts = self.filled_neighbour_counts(empty)
+        self.filled_neighbours = counts.tolist()
+        self.heuristic = int((counts[empty].astype(np.int64) ** 2).sum())
+
+    def compute_candidates(self) -> dict:
+        """ Calcula de uma vez as posições candidatas de todos os números em
+        falta com números adjacentes colocados: as posições vazias em redor
+        do adjacente anterior (ou do seguinte, se o anterior faltar) que,
+        havendo os dois, também são vizinhas do seguinte. Devolve
+        {número: [(linha, coluna)]}, pela ordem da tabela de vizinhos. """
+        dim = self.dim
+        size = dim * dim
+        empty = self.empty_mask()
+        rows = np.full(size + 2, -dim - 2, dtype=np.int64)
+        cols = np.full(size + 2, -dim - 2, dtype=np.int64)
+        for number, (row, col) in self.positions.items():
+            rows[number] = row
+            cols[number] = col
+        placed = np.zeros(size + 2, dtype=bool)
+        placed[list(self.positions)] = True
+
+        numbers = np.flatnonzero(np.frombuffer(bytes(self.missing), dtype=np.uint8))
+        before = placed[numbers - 1]
+        after = placed[numbers + 1]
+        anchored = before | after
+        numbers, before, after = numbers[anchored], before[anchored], after[anchored]
+        anchors = np.where(before, numbers - 1, numbers + 1)
+        both = before & after
+
+        found = np.zeros((len(numbers), len(self.DIRECTIONS)), dtype=bool)
+        candidate_rows = np.empty_like(found, dtype=np.int64)
+        candidate_cols = np.empty_like(found, dtype=np.int64)
+        for index, (drow, dcol) in enumerate(self.DIRECTIONS):
+            row = rows[anchors] + drow
+            col = cols[anchors] + dcol
+            inside = (row >= 0) & (row < dim) & (col >= 0) & (col < dim)
+            ok = inside & empty[np.clip(row, 0, dim - 1), np.clip(col, 0, dim - 1)]
+            next_distance = np.abs(row - rows[numbers + 1]) + np.abs(col - cols[numbers + 1])
+            found[:, index] = ok & (~both | (next_distance == 1))
+            candidate_rows[:, index] = row
+            candidate_cols[:, index] = col
+
+        return {number: [(r, c) for r, c, ok in zip(r_list, c_list, ok_list) if ok]
+                for number, r_list, c_list, ok_list in zip(numbers.tolist(), candidate_rows.tolist(),
+                                                           candidate_cols.tolist(), found.tolist())}
+
+    def init_candidates(self) -> None:
+        self.reset_candidates()
+        computed = self.compute_candidates()
+        for number in self.iter_missing_numbers():
+            self.set_candidates(number, computed.get(number))
+
+
+# Representações de tabuleiro disponíveis
+BOARDS = {"list": Board, "flat": FlatBoard, "bits": BitBoard, "numpy": NumpyBoard}
+
+
+def least_constraining(board: Board, number: int, position) -> int:
+    """ Prefere as posições que menos outros números em falta perdem. """
+    return board.constraint_impact(number, *position)
+
+
+def wall_hugging(board: Board, number: int, position) -> int:
+    """ Prefere as posições encostadas a paredes, cantos e números colocados. """
+    return board.count_empty_neighbours(*position)
+
+
+def heuristic_delta(board: Board, number: int, position) -> int:
+    """ Prefere as posições que menos aumentam a heurística. """
+    return board.heuristic_delta(*position)
+
+
+# Estratégias de ordenação das posições do número escolhido: a função dá um
+# valor a cada posição e as de menor valor são tentadas primeiro
+# ("table" mantém a ordem da tabela de vizinhos)
+VALUE_ORDERS = {
+    "table": None,
+    "constraining": least_constraining,
+    "walls": wall_hugging,
+    "heuristic": heuristic_delta,
+}
 
 
 class Numbrix(Problem):
 
-    def __init__(self, board: Board):
-        """ O construtor especifica o estado inicial. """
+    def __init__(self, board: Board, propagate: bool = False, region_pruning: bool = False,
+                 nogood_memory: int = 0, nogood_policy: str = "lru",
+                 domains: bool = False, mrv: bool = False, value_order: str = "table"):
+        """ O construtor especifica o estado inicial. Com propagate, é feita
+        propagação de restrições no tabuleiro inicial e depois de cada jogada;
+        com region_pruning, o actions rejeita os estados com regiões vazias
+        que não podem ser preenchidas; com nogood_memory > 0, o
+        in_place_depth_first_search usa até esse número de bytes numa cache de
+        tabuleiros sem solução, com a política de remoção nogood_policy; com
+        domains, o actions calcula o domínio de cada número em falta com mapas
+        de distâncias (Board.compute_domains) e escolhe o número com menos
+        posições; com mrv, escolhe o número com menos posições candidatas
+        (vizinhas dos adjacentes colocados) em vez de seguir a ordem fixa;
+        value_order escolhe a ordem pela qual as posições do número são
+        tentadas (ver VALUE_ORDERS). As opções domains e mrv escolhem o número
+        de maneiras diferentes, por isso não podem ser usadas juntas. """
+        if value_order not in VALUE_ORDERS:
+            raise ValueError("Ordem de valores desconhecida: %s" % value_order)
+        if domains and mrv:
+            raise ValueError("As opções domains e mrv não podem ser usadas juntas")
         self.initial = NumbrixState(board)
+        self.propagate = propagate
+        self.region_pruning = region_pruning
+        self.domains = domains
+        self.mrv = mrv
+        self.value_order = value_order
+        self.nogoods = NogoodCache(nogood_memory, nogood_policy) if nogood_memory > 0 else None
+        # Estados verificados e estados cortados pela poda por regiões
+        self.region_checks = 0
+        self.region_cuts = 0
+        if mrv:
+            board.enable_mrv()
+        if propagate:
+            self.initial.dead = not board.propagate([])
+
+    @property
+    def options(self) -> dict:
+        """ Opções do construtor, para criar o mesmo problema noutro processo. """
+        return {"propagate": self.propagate, "region_pruning": self.region_pruning, "domains": self.domains, "mrv": self.mrv,
+                "value_order": self.value_order,
+                "nogood_memory": self.nogoods.limit if self.nogoods is not None else 0,
+                "nogood_policy": self.nogoods.policy if self.nogoods is not None else "lru"}
+
+    @property
+    def counters(self) -> tuple:
+        """ Contadores da procura (poda por regiões e cache de tabuleiros
+        sem solução), para somar os de problemas resolvidos noutro processo. """
+        return self.region_checks, self.region_cuts, self.nogoods.counters if self.nogoods is not None else None
+
+    def add_counters(self, counters: tuple) -> None:
+        region_checks, region_cuts, nogood_counters = counters
+        self.region_checks += region_checks
+        self.region_cuts += region_cuts
+        if self.nogoods is not None and nogood_counters is not None:
+            self.nogoods.add_counters(nogood_counters)
 
     def actions(self, state: NumbrixState):
         """ Retorna uma lista de ações que podem ser executadas a
-        partir do estado passado como argumento. """
+        partir do estado passado como argumento. Não altera o estado. """
 
         board = state.board
-        missing_numbers = board.missing_numbers
-        choice = missing_numbers[0]
-
-        max_seq = [x for x in number_seqs[choice] if x not in missing_numbers]
-        choice_possible_positions = board.get_empty_neighbours_positions(*board.positions[max_seq[0]])
-        chosen = False
-        if len(max_seq) == 2:
-            choice_possible_positions = [pos for pos in choice_possible_positions if pos in set(board.get_empty_neighbours_positions(*board.positions[max_seq[1]]))]
-        if len(choice_possible_positions) == 1:
-            chosen = True
-        if not chosen:
-            for number in missing_numbers[1:]:    
-            
-                # Lista de números possiveis para cada número baseado nos números que já foram preenchidos
-                # [número-1,número+1] or [número-1] or [número+1]
-                max_seq = [x for x in number_seqs[number] if x not in missing_numbers]
-                if len(max_seq) == 0:
-                    continue
-                
-                # Cria uma lista que resulta da interseção de todos os vizinhos vazios de cada número em max_seq
-                # Estas são as únicas posições válidas à partida para o número em causa
-                possible_positions = board.get_empty_neighbours_positions(*board.positions[max_seq[0]])
-                if len(max_seq) == 2:
-                    possible_positions = [pos for pos in possible_positions if pos in set(board.get_empty_neighbours_positions(*board.positions[max_seq[1]]))]
-                if len(possible_positions) == 1:
-                    choice = number
-                    choice_possible_positions = possible_positions
-                    break
 
-        missing_numbers.remove(choice)
+        # Há um número em falta sem nenhuma posição possível, ou dois números
+        # colocados sem espaço para o caminho entre eles
+        if state.dead or board.blocked or board.infeasible_gaps:
+            return []
+
+        if self.region_pruning:
+            self.region_checks += 1
+            if not board.regions_feasible():
+                self.region_cuts += 1
+                return []
+
+        if self.domains:
+            return self.domain_actions(board)
+
+        # Se houver números com uma só posição possível, escolhe o primeiro
+        # deles pela ordem de prioridade; senão o primeiro número em falta
+        # (ou, com mrv, o que tem menos candidatas)
+        if self.mrv:
+            choice = board.most_constrained_number()
+        elif board.forced:
+            choice = min(board.forced, key=board.order_index.__getitem__)
+        else:
+            choice = board.first_missing_number()
+
+        # Interseção dos vizinhos vazios dos números adjacentes já colocados;
+        # sem nenhum colocado, o número pode ir para qualquer posição vazia
+        choice_possible_positions = board.candidates[choice]
+        if choice_possible_positions is None:
+            choice_possible_positions = list(board.empty_pos)
 
-        return [(*x, choice) for x in choice_possible_positions if board.locked_condition(choice, x)]
+        return [(*x, choice) for x in self.order_values(board, choice, choice_possible_positions)
+                if board.locked_condition(choice, x)]
+
+    def order_values(self, board: Board, choice: int, positions: list) -> list:
+        """ Ordena as posições do número escolhido pela estratégia
+        value_order. Os motores DFS tentam primeiro a última ação, por isso
+        a posição mais promissora (menor valor) fica no fim; os empates
+        mantêm a ordem da tabela de vizinhos. """
+        key = VALUE_ORDERS[self.value_order]
+        if key is None:
+            return positions
+        return sorted(positions, key=lambda position: key(board, choice, position), reverse=True)
+
+    def domain_actions(self, board: Board) -> list:
+        """ Ações do número em falta com menor domínio (desempate pela ordem
+        de prioridade), ou nenhuma se algum número ficou sem posições. """
+        domains = board.compute_domains()
+        if len(domains) < board.missing_count:
+            return []
+        order_index = board.order_index
+        choice = min(domains, key=lambda number: (len(domains[number]), order_index[number]))
+        positions = domains[choice]
+        # Mantém a ordem da tabela de vizinhos quando há adjacentes colocados
+        if board.candidates[choice] is not None:
+            allowed = set(positions)
+            positions = [position for position in board.candidates[choice] if position in allowed]
+        return [(*x, choice) for x in self.order_values(board, choice, positions) if board.locked_condition(choice, x)]
 
     def result(self, state: NumbrixState, action):
         """ Retorna o estado resultante de executar a 'action' sobre
@@ -253,38 +1438,442 @@ class Numbrix(Problem):
         das presentes na lista obtida pela execução de 
         self.actions(state). """
         new_state = pickle.loads(pickle.dumps(state, -1))
-        new_state.board.add_number(*action)
+        self.apply(new_state, action)
         return new_state
 
+    def apply(self, state: NumbrixState, action) -> list:
+        """ Executa a 'action' diretamente sobre 'state' (seguida da
+        propagação, se estiver ativa) e devolve a lista de jogadas feitas,
+        que o undo usa para repor o estado. """
+        state.board.add_number(*action)
+        moves = [action]
+        if self.propagate:
+            state.dead = not state.board.propagate(moves)
+        return moves
+
+    def undo(self, state: NumbrixState, moves: list) -> None:
+        """ Desfaz as jogadas devolvidas pelo apply, pela ordem inversa. """
+        for move in reversed(moves):
+            state.board.remove_number(*move)
+        state.dead = False
+
     def goal_test(self, state: NumbrixState):
-        return len(state.board.missing_numbers) == 0
+        return state.board.missing_count == 0
 
     def h(self, node: Node):
-        board = node.state.board
-        total = 0
-        empty_positions = board.empty_pos
-        for space in empty_positions:
-            total += (len(board.get_filled_neighbours_positions(*space)))**2
-        return total
+        """ Soma, nas posições vazias, do quadrado do número de vizinhos
+        preenchidos. O Board mantém este valor a cada jogada, por isso o
+        custo é O(1) por nó. """
+        return node.state.board.heuristic
 
 
-def main():
-    # Lê tabuleiro do ficheiro
-    board = Board.parse_instance(sys.argv[1])
+class NogoodCache:
+    """ Cache de tabuleiros parciais cuja subárvore foi explorada sem
+    encontrar solução. A impressão digital é a do subproblema que falta
+    resolver (Board.subproblem_key), o limite é dado em bytes e a política de
+    remoção pode ser 'lru' (sai o usado há mais tempo) ou 'fifo' (sai o
+    guardado há mais tempo). """
+
+    # Custo aproximado de uma entrada no dicionário, além da própria chave
+    ENTRY_OVERHEAD = 3 * sys.getsizeof(0)
+
+    def __init__(self, max_bytes: int, policy: str = "lru") -> None:
+        if policy not in NOGOOD_POLICIES:
+            raise ValueError("Política de remoção desconhecida: %s" % policy)
+        self.limit = max_bytes
+        self.policy = policy
+        # Com 'lru', um acerto passa a entrada para o fim da fila de remoção
+        self.refresh_on_hit = policy == "lru"
+        self.used = 0
+        # {impressão digital: None}, da primeira a sair para a última
+        self.table = {}
+        self.hits = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def fingerprint(self, state: NumbrixState):
+        """ Chave com que o estado é guardado na cache. """
+        return state.board.subproblem_key()
+
+    def entry_size(self, key) -> int:
+        """ Espaço ocupado por uma entrada, em bytes. """
+        return sys.getsizeof(key) + self.ENTRY_OVERHEAD
+
+    def __contains__(self, key) -> bool:
+        if key not in self.table:
+            return False
+        if self.refresh_on_hit:
+            del self.table[key]
+            self.table[key] = None
+        self.hits += 1
+        return True
+
+    def add(self, key) -> None:
+        if key in self.table:
+            return
+        size = self.entry_size(key)
+        while self.table and self.used + size > self.limit:
+            oldest = next(iter(self.table))
+            del self.table[oldest]
+            self.used -= self.entry_size(oldest)
+            self.evictions += 1
+        self.table[key] = None
+        self.used += size
+        self.stores += 1
+
+    @property
+    def counters(self) -> tuple:
+        """ (guardados, repetidos, removidos, bytes usados). """
+        return self.stores, self.hits, self.evictions, self.used
+
+    def add_counters(self, counters: tuple) -> None:
+        """ Soma os contadores de uma cache de outro processo (os bytes
+        passam a ser os usados pelas duas). """
+        stores, hits, evictions, used = counters
+        self.stores += stores
+        self.hits += hits
+        self.evictions += evictions
+        self.used += used
+
+
+def in_place_depth_first_search(problem: Numbrix):
+    """ Procura em profundidade que altera um único tabuleiro em vez de
+    copiar o estado para cada filho. Cada nível da pilha guarda as ações
+    que faltam explorar; o rasto guarda as jogadas feitas por cada apply
+    (incluindo as da propagação), que são desfeitas ao recuar.
+    Se o problema tiver cache de tabuleiros sem solução, cada tabuleiro
+    cuja subárvore falhou é lá guardado e os filhos que já lá estão são
+    desfeitos sem ser expandidos.
+    Visita os filhos pela mesma ordem que o depth_first_tree_search e
+    devolve o estado objetivo (ou None se não houver solução). """
+    state = problem.initial
+    if problem.goal_test(state):
+        return state
+    nogoods = problem.nogoods
+
+    # [iterador de ações]
+    stack = [reversed(problem.actions(state))]
+    # [[(linha, coluna, número)]]
+    trail = []
+    while stack:
+        action = next(stack[-1], None)
+        if action is None:
+            # Todos os filhos falharam: desfaz o nó atual
+            stack.pop()
+            if nogoods is not None:
+                nogoods.add(nogoods.fingerprint(state))
+            if trail:
+                problem.undo(state, trail.pop())
+            continue
+        moves = problem.apply(state, action)
+        if problem.goal_test(state):
+            return state
+        if nogoods is not None and nogoods.fingerprint(state) in nogoods:
+            problem.undo(state, moves)
+            continue
+        trail.append(moves)
+        stack.append(reversed(problem.actions(state)))
+    return None
+
+
+# Cache de tabuleiros sem solução de cada processo do pool, partilhada
+# pelas subárvores que ele explora (None se não for usada)
+_worker_nogoods = None
+
+
+def _init_search_worker(nogood_memory: int, nogood_policy: str) -> None:
+    """ Cria a cache de tabuleiros sem solução do processo do pool. """
+    global _worker_nogoods
+    _worker_nogoods = NogoodCache(nogood_memory, nogood_policy) if nogood_memory > 0 else None
+
+
+def _search_subtree(task):
+    """ Procura uma solução a partir de um tabuleiro parcial, num processo
+    do pool, usando a cache de tabuleiros sem solução do processo. Recebe
+    (tabuleiro, opções do Numbrix) e devolve o tabuleiro resolvido (ou
+    None) e os contadores desta subárvore. """
+    board, problem_options = task
+    problem = Numbrix(board, **problem_options)
+    problem.nogoods = _worker_nogoods
+    before = _worker_nogoods.counters if _worker_nogoods is not None else None
+    state = in_place_depth_first_search(problem)
+    region_checks, region_cuts, nogood_counters = problem.counters
+    if nogood_counters is not None:
+        nogood_counters = tuple(after - start for after, start in zip(nogood_counters, before))
+    return (state.board if state is not None else None), (region_checks, region_cuts, nogood_counters)
+
+
+# Profundidade até à qual a raiz é expandida antes de distribuir as subárvores
+PARALLEL_SPLIT_DEPTH = 3
 
-    # Cria uma instância de Numbrix
-    problem = Numbrix(board)
 
-    # Obtém o nó solução usando DFS
+def parallel_depth_first_search(problem: Numbrix, split_depth: int = PARALLEL_SPLIT_DEPTH, workers: int = None):
+    """ Expande a raiz em largura até split_depth níveis e distribui os
+    tabuleiros parciais resultantes por workers processos, que os exploram
+    com in_place_depth_first_search. As subárvores são enviadas pela ordem
+    em que o depth_first_tree_search as visitaria e, assim que uma delas
+    encontra o objetivo, o pool é terminado, cancelando as restantes.
+    Cada processo tem uma cache de tabuleiros sem solução com a memória
+    do problema dividida pelos processos, para o total não passar do
+    limite. Os contadores das subárvores terminadas são somados aos do
+    problema. Devolve o estado objetivo ou None. """
+    frontier = [Node(problem.initial)]
+    for _ in range(split_depth):
+        next_frontier = []
+        for node in frontier:
+            if problem.goal_test(node.state):
+                return node.state
+            # O DFS visita primeiro o último filho
+            next_frontier.extend(reversed(node.expand(problem)))
+        frontier = next_frontier
+
+    for node in frontier:
+        if problem.goal_test(node.state):
+            return node.state
+
+    workers = workers or os.cpu_count() or 1
+    options = dict(problem.options, nogood_memory=0)
+    nogood_memory = problem.nogoods.limit // workers if problem.nogoods is not None else 0
+    with multiprocessing.Pool(workers, _init_search_worker, (nogood_memory, options["nogood_policy"])) as pool:
+        tasks = [(node.state.board, options) for node in frontier if not node.state.dead]
+        for board, counters in pool.imap_unordered(_search_subtree, tasks):
+            problem.add_counters(counters)
+            if board is not None:
+                # Sair do with termina os processos que ainda estão a procurar
+                return NumbrixState(board)
+    return None
+
+
+def report_speedup(filename: str, board: str = "list", problem_options: dict = None, **options) -> None:
+    """ Resolve o tabuleiro em série (inplace) e em paralelo e escreve os
+    tempos e o speedup no stderr. """
+    _, serial = solve_file(filename, "inplace", board, problem_options)
+    _, parallel = solve_file(filename, "parallel", board, problem_options, **options)
+    print("%s: série %.3fs, paralelo %.3fs, speedup %.2fx" % (filename, serial, parallel, serial / parallel),
+          file=sys.stderr)
+
+
+def solve(problem: Numbrix, engine: str = "dfs", **options):
+    """ Resolve o problema com o motor de procura escolhido e devolve o
+    estado final (ou None se não houver solução). As opções extra são
+    passadas ao motor parallel. """
+    if engine == "inplace":
+        return in_place_depth_first_search(problem)
+    if engine == "parallel":
+        return parallel_depth_first_search(problem, **options)
     goal_node = depth_first_tree_search(problem)
     # goal_node = greedy_search(problem, problem.h) # 
     # goal_node = astar_search(problem, display=True)
+    return goal_node.state if goal_node is not None else None
+
+
+def solve_file(filename: str, engine: str = "dfs", board: str = "list", problem_options: dict = None, **options):
+    """ Lê e resolve o tabuleiro do ficheiro, criando o Numbrix com
+    problem_options. Devolve o estado final (ou None) e o tempo gasto, em
+    segundos. """
+    start = time.perf_counter()
+    problem = Numbrix(BOARDS[board].parse_instance(filename), **(problem_options or {}))
+    state = solve(problem, engine, **options)
+    return state, time.perf_counter() - start
+
+
+def expand_filenames(names):
+    """ Devolve os ficheiros a resolver a partir dos argumentos: um caminho
+    pode ser um ficheiro, uma pasta (todos os input*.txt lá dentro), um
+    padrão glob, ou '-' para ler um caminho por linha do stdin. As pastas
+    e os padrões que não dão nenhum ficheiro são avisados no stderr. """
+    for name in names:
+        if name == "-":
+            yield from expand_filenames(line.strip() for line in sys.stdin if line.strip())
+            continue
+        if os.path.isdir(name):
+            matches = sorted(glob.glob(os.path.join(name, "input*.txt")))
+        elif any(char in name for char in "*?["):
+            matches = sorted(glob.glob(name))
+        else:
+            yield name
+            continue
+        if not matches:
+            print("Aviso: nenhum tabuleiro encontrado em %s" % name, file=sys.stderr)
+        yield from matches
+
+
+# Separador entre tabuleiros no modo batch (o mesmo do test.sh)
+BATCH_SEPARATOR = "-----------------------------"
+
+
+def print_batch_result(filename: str, state, elapsed: float, error: str = None) -> None:
+    """ Imprime o resultado de um tabuleiro no modo batch: o caminho, o
+    tabuleiro no formato do print_board (ou o erro), o tempo e o separador. """
+    print(filename)
+    if error is not None:
+        print("Erro: " + error)
+    elif state is None:
+        print("Sem solução")
+    else:
+        state.board.print_board()
+    print("%.3fs" % elapsed)
+    print(BATCH_SEPARATOR)
+    print()
+
+
+def batch_solve(filenames, engine: str = "dfs", board: str = "list", **options) -> None:
+    """ Resolve todos os tabuleiros no mesmo processo, poupando o arranque
+    do interpretador e a construção das tabelas por cada tabuleiro. Um
+    ficheiro que não possa ser lido ou resolvido é reportado como erro,
+    como no _solve_task, e os restantes continuam a ser resolvidos. """
+    for filename in filenames:
+        try:
+            state, elapsed = solve_file(filename, engine, board, **options)
+        except Exception as error:
+            print_batch_result(filename, None, 0.0, "%s: %s" % (type(error).__name__, error))
+        else:
+            print_batch_result(filename, state, elapsed)
+        sys.stdout.flush()
+
+
+class SolveTimeout(Exception):
+    """ Lançada quando um tabuleiro excede o tempo limite no modo paralelo. """
+
+
+def _raise_timeout(signum, frame):
+    raise SolveTimeout()
+
+
+def _solve_task(filename: str, engine: str, board: str, timeout: float, problem_options: dict = None):
+    """ Resolve um tabuleiro num processo do pool. O tempo limite usa o
+    SIGALRM, por isso só é aplicado em sistemas que o suportam.
+    Devolve (ficheiro, estado, tempo, erro). """
+    use_alarm = timeout and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        state, elapsed = solve_file(filename, engine, board, problem_options)
+        return filename, state, elapsed, None
+    except SolveTimeout:
+        return filename, None, timeout, "tempo limite de %gs excedido" % timeout
+    except Exception as error:
+        return filename, None, 0.0, "%s: %s" % (type(error).__name__, error)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _solve_chunk(filenames: list, engine: str, board: str, timeout: float, problem_options: dict = None) -> list:
+    """ Resolve um bloco de tabuleiros no mesmo processo do pool. """
+    return [_solve_task(filename, engine, board, timeout, problem_options) for filename in filenames]
+
+
+def parallel_batch_solve(filenames, engine: str = "dfs", board: str = "list", workers: int = None,
+                         chunksize: int = 1, timeout: float = None, ordered: bool = True,
+                         problem_options: dict = None):
+    """ Distribui os tabuleiros por um ProcessPoolExecutor com workers
+    processos, em blocos de chunksize tabuleiros, cada um com timeout
+    segundos no máximo. Gera (ficheiro, estado, tempo, erro) à medida que
+    os blocos terminam: pela ordem de submissão se ordered, senão pela
+    ordem em que acabam. """
+    filenames = list(filenames)
+    chunks = [filenames[i:i + chunksize] for i in range(0, len(filenames), chunksize)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_solve_chunk, chunk, engine, board, timeout, problem_options) for chunk in chunks]
+        for future in (futures if ordered else as_completed(futures)):
+            yield from future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resolve tabuleiros de Numbrix.")
+    parser.add_argument("filenames", nargs="+", metavar="filename",
+                        help="ficheiro com o tabuleiro; com vários ficheiros, pastas, padrões "
+                             "glob ou '-' (caminhos lidos do stdin) resolve todos em modo batch")
+    parser.add_argument("--engine", choices=("dfs", "inplace", "parallel"), default="dfs",
+                        help="dfs: depth_first_tree_search com cópia de estados; "
+                             "inplace: DFS sobre um único tabuleiro com desfazer; "
+                             "parallel: subárvores do DFS distribuídas por vários processos")
+    parser.add_argument("--board", choices=tuple(BOARDS), default="list",
+                        help="representação interna do tabuleiro")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="número de processos do modo batch ou do motor parallel (0: um por CPU)")
+    parser.add_argument("--chunksize", type=int, default=1,
+                        help="tabuleiros enviados de cada vez a um processo")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="tempo limite por tabuleiro, em segundos, com --workers")
+    parser.add_argument("--order", choices=("submission", "completion"), default="submission",
+                        help="ordem pela qual os resultados paralelos são impressos")
+    parser.add_argument("--split-depth", type=int, default=PARALLEL_SPLIT_DEPTH,
+                        help="níveis expandidos antes de distribuir as subárvores (motor parallel)")
+    parser.add_argument("--propagate", action="store_true",
+                        help="propagação de restrições antes e entre os passos da procura")
+    parser.add_argument("--region-pruning", action="store_true",
+                        help="rejeita estados com regiões vazias que não podem ser preenchidas")
+    parser.add_argument("--domains", action="store_true",
+                        help="escolhe o número com menos posições possíveis, por mapas de distâncias")
+    parser.add_argument("--mrv", action="store_true",
+                        help="escolhe o número com menos posições candidatas em vez da ordem fixa")
+    parser.add_argument("--value-order", choices=tuple(VALUE_ORDERS), default="table",
+                        help="ordem pela qual as posições do número escolhido são tentadas")
+    parser.add_argument("--nogoods", type=float, nargs="?", const=NOGOOD_CACHE_MB, default=0, metavar="MB",
+                        help="memória da cache de tabuleiros sem solução (motores inplace e parallel)")
+    parser.add_argument("--nogood-policy", choices=NOGOOD_POLICIES, default="lru",
+                        help="política de remoção da cache de tabuleiros sem solução")
+    parser.add_argument("--speedup", action="store_true",
+                        help="compara o motor parallel com o inplace e escreve o speedup no stderr")
+    args = parser.parse_args()
+
+    filenames = list(expand_filenames(args.filenames))
+    if not filenames:
+        parser.error("nenhum tabuleiro para resolver")
+    if args.domains and args.mrv:
+        parser.error("--domains e --mrv não podem ser usadas juntas")
+    if args.nogoods and args.engine == "dfs" and not args.speedup:
+        parser.error("--nogoods só é usado pelos motores inplace e parallel")
+    options = {"problem_options": {"propagate": args.propagate, "region_pruning": args.region_pruning,
+                                   "domains": args.domains, "mrv": args.mrv,
+                                   "value_order": args.value_order,
+                                   "nogood_memory": int(args.nogoods * 2 ** 20),
+                                   "nogood_policy": args.nogood_policy}}
+    if args.engine == "parallel" or args.speedup:
+        options.update(split_depth=args.split_depth, workers=args.workers or None)
+    if args.speedup:
+        for filename in filenames:
+            report_speedup(filename, args.board, **options)
+        return
+    if args.engine != "parallel" and args.workers not in (None, 1):
+        results = parallel_batch_solve(filenames, args.engine, args.board, args.workers or None,
+                                       args.chunksize, args.timeout, args.order == "submission", options["problem_options"])
+        for result in results:
+            print_batch_result(*result)
+            sys.stdout.flush()
+        return
+    if len(filenames) != 1 or filenames[0] != args.filenames[0]:
+        batch_solve(filenames, args.engine, args.board, **options)
+        return
+
+    # Lê tabuleiro do ficheiro
+    board = BOARDS[args.board].parse_instance(filenames[0])
+
+    # Cria uma instância de Numbrix
+    problem = Numbrix(board, **options.pop("problem_options"))
+
+    # Obtém o estado solução
+    state = solve(problem, args.engine, **options)
+    if problem.region_pruning:
+        print("Poda por regiões: %d de %d estados cortados" % (problem.region_cuts, problem.region_checks),
+              file=sys.stderr)
+    if problem.nogoods is not None:
+        cache = problem.nogoods
+        print("Cache de tabuleiros sem solução: %d tabuleiros guardados, %d repetidos, %d removidos, %d bytes"
+              % (cache.stores, cache.hits, cache.evictions, cache.used), file=sys.stderr)
 
     # Mostra tabuleiro final
-    goal_node.state.board.print_board()
+    if state is None:
+        print("Sem solução")
+    else:
+        state.board.print_board()
 
 
 if __name__ == "__main__":
-    neighbours_positions = {}
-    number_seqs = {}
     main()
\ No newline at end of file
@@ -8,6 +8,7 @@
 
 
 import sys
+import bisect
 import pickle
 
 from search import Problem, Node, depth_first_tree_search, greedy_search, astar_search
@@ -27,6 +28,13 @@ class NumbrixState:
 class Board:
     """ Representação interna de um tabuleiro de Numbrix. """
 
+    # Buffer de posições visitadas reutilizado pelas procuras do has_empty_path,
+    # partilhado por todos os tabuleiros (assim não é copiado com o estado).
+    # Uma posição foi visitada na procura atual se tiver a geração atual.
+    # {dim: [[geração]]}
+    visit_stamps = {}
+    visit_generation = 0
+
     def __init__(self, board: list, dim: int) -> None:
 
         # Atributos basicos
@@ -62,6 +70,10 @@ class Board:
         # [número]
         self.missing_numbers = self.get_number_choice_order(list(self.positions.keys()))
 
+        # Lista ordenada dos números já colocados
+        # [número]
+        self.used_numbers = sorted(self.positions.keys())
+
     def get_number_choice_order(self, used_numbers):
         """ Encontra o melhor número em falta para colocar no board. """
         used_numbers = sorted(used_numbers + [0, self.dim**2 + 1])
@@ -129,35 +141,124 @@ class Board:
         self.board[row][col] = number
         self.positions[number] = (row, col)
         self.empty_pos.remove((row, col))
+        bisect.insort(self.used_numbers, number)
     
-    def has_empty_path(self, number, max_seq, position):
+    def new_visit(self):
+        """ Começa uma nova procura sobre o buffer de visitados: em vez de o
+        limpar, avança a geração. Devolve o buffer e a nova geração. """
+        if self.dim not in Board.visit_stamps:
+            Board.visit_stamps[self.dim] = [[0] * self.dim for _ in range(self.dim)]
+        Board.visit_generation += 1
+        return Board.visit_stamps[self.dim], Board.visit_generation
+
+    def empty_path_length(self, position, goal_position, limit):
+        """ Procura em largura pelas posições vazias a partir de position,
+        com no máximo limit passos. Devolve o menor número de passos até
+        goal_position, ou None se não for alcançável. """
+        stamps, generation = self.new_visit()
+        stamps[position[0]][position[1]] = generation
+        frontier = [position]
+        for depth in range(1, limit + 1):
+            next_frontier = []
+            for cell in frontier:
+                for (y, x) in neighbours_positions[cell]:
+                    if (y, x) == goal_position:
+                        return depth
+                    if self.board[y][x] == 0 and stamps[y][x] != generation:
+                        stamps[y][x] = generation
+                        next_frontier.append((y, x))
+            if not next_frontier:
+                return None
+            frontier = next_frontier
+        return None
+
+    def regions_have_room(self, number, position) -> bool:
+        """ Com o número colocado em position, divide as posições vazias em
+        regiões ligadas e verifica que cada intervalo de números em falta
+        entre dois números colocados cabe numa região vizinha de ambos, e
+        que nenhuma região tem mais posições do que os números dos
+        intervalos que lá podem ficar. """
+        size = self.dim ** 2
+        self.board[position[0]][position[1]] = number
+        try:
+            # Cada região fica marcada no buffer com base + índice da região
+            stamps, base = self.new_visit()
+            region_sizes = []
+            for (row, col) in self.empty_pos:
+                if self.board[row][col] != 0 or stamps[row][col] >= base:
+                    continue
+                label = base + len(region_sizes)
+                stamps[row][col] = label
+                stack = [(row, col)]
+                count = 0
+                while stack:
+                    cell = stack.pop()
+                    count += 1
+                    for (y, x) in neighbours_positions[cell]:
+                        if self.board[y][x] == 0 and stamps[y][x] < base:
+                            stamps[y][x] = label
+                            stack.append((y, x))
+                region_sizes.append(count)
+            Board.visit_generation = base + len(region_sizes)
+
+            def touching(placed_number):
+                """ Regiões vizinhas da posição do número. """
+                cell = position if placed_number == number else self.positions[placed_number]
+                return {stamps[y][x] - base for (y, x) in neighbours_positions[cell] if self.board[y][x] == 0}
+
+            placed = self.used_numbers[:]
+            bisect.insort(placed, number)
+            bounds = [0] + placed + [size + 1]
+            demand = [0] * len(region_sizes)
+            supply = [0] * len(region_sizes)
+            for a, b in zip(bounds, bounds[1:]):
+                length = b - a - 1
+                if length == 0:
+                    continue
+                if a == 0:
+                    regions = touching(b)
+                elif b == size + 1:
+                    regions = touching(a)
+                else:
+                    regions = touching(a) & touching(b)
+                if not regions:
+                    return False
+                if len(regions) == 1:
+                    demand[next(iter(regions))] += length
+                for region in regions:
+                    supply[region] += length
+            return all(demand[i] <= region_sizes[i] <= supply[i] for i in range(len(region_sizes)))
+        finally:
+            self.board[position[0]][position[1]] = 0
 
-        def recursive_dls(position, goal_number, depth, limit):
-            if depth == limit:
-                return goal_number in self.get_neighbours(*position)
-            else:
-                for (y, x) in neighbours_positions[position]:
-                    value = self.board[y][x]
-                    if (value == 0 or (closest and value == goal_number-depth) or value == goal_number+depth) and recursive_dls((y, x), goal_number, depth+1, limit):
-                        return True
-                return False
+    def has_empty_path(self, number, max_seq, position):
+        """ Verifica que, com o número em position, as regiões vazias têm
+        espaço para os números em falta e que ainda há caminho por posições
+        vazias até ao próximo número colocado (no sentido oposto a max_seq)
+        com exatamente |número - objetivo| passos. """
+        if not self.regions_have_room(number, position):
+            return False
 
         if len(max_seq) == 2:
             return True
 
-        # closest is true if the number we're looking for is higher than it, false otherwise
-        used_numbers = sorted(list(self.positions.keys()))
-        closest = max_seq[0] < number
+        used_numbers = self.used_numbers
         if number < used_numbers[0] or number > used_numbers[-1]:
             return True
 
-        for i in range(0, len(used_numbers) - 1):
-            if used_numbers[i] < number < used_numbers[i+1]:
-                goal_number = used_numbers[i+1] if closest else used_numbers[i]
-                break
-
-        # Body of depth_limited_search:
-        return recursive_dls(position, goal_number, 1, abs(number-goal_number))
+        # O objetivo é o número colocado seguinte se max_seq for o anterior, e vice-versa
+        index = bisect.bisect(used_numbers, number)
+        goal_number = used_numbers[index] if max_seq[0] < number else used_numbers[index - 1]
+        limit = abs(number - goal_number)
+
+        length = self.empty_path_length(position, self.positions[goal_number], limit)
+        if length is None:
+            return False
+        # A grelha é bipartida, por isso o caminho mais curto só pode ser
+        # alongado de 2 em 2 passos, indo e voltando entre duas posições vazias
+        if (limit - length) % 2 != 0:
+            return False
+        return length == limit or length > 1 or len(self.get_empty_neighbours_positions(*position)) > 0
 
     def locked_condition(self, number, position) -> bool:
         """ Verifica que os vizinhos do número não ficam presos invalidamente
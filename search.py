@@ -6,6 +6,8 @@ then create problem instances and solve them with calls to the various search
 functions.
 """
 
+import heapq
+import itertools
 import sys
 from collections import deque
 
@@ -61,6 +63,21 @@ class Problem:
         and related algorithms try to maximize this value."""
         raise NotImplementedError
 
+    def apply(self, state, action):
+        """Optional: execute the action by changing state itself, and return
+        whatever undo needs to restore it. Problems whose states are costly
+        to copy can implement apply and undo so that the in_place_* searches
+        change a single state instead of calling result for every child."""
+        raise NotImplementedError
+
+    def undo(self, state, token):
+        """Optional: revert the apply that returned token."""
+        raise NotImplementedError
+
+    def has_undo(self):
+        """Return True if the problem implements apply and undo."""
+        return type(self).apply is not Problem.apply and type(self).undo is not Problem.undo
+
 
 # ______________________________________________________________________________
 
@@ -96,6 +113,16 @@ class Node:
         return [self.child_node(problem, action)
                 for action in problem.actions(self.state)]
 
+    def iter_children(self, problem, reverse=False):
+        """Yield the nodes reachable in one step from this node, one at a
+        time, so that children that are never visited are never built.
+        With reverse, they come in the reverse order of the actions."""
+        actions = problem.actions(self.state)
+        if reverse:
+            actions = reversed(list(actions))
+        for action in actions:
+            yield self.child_node(problem, action)
+
     def child_node(self, problem, action):
         """[Figure 3.10]"""
         next_state = problem.result(self.state, action)
@@ -203,13 +230,18 @@ def depth_first_tree_search(problem):
     Repeats infinitely in case of loops.
     """
 
-    frontier = [Node(problem.initial)]  # Stack
+    # Stack of child generators: the children of a node are only built as
+    # they are popped, the last action first (the order of a list frontier)
+    frontier = [iter([Node(problem.initial)])]
 
     while frontier:
-        node = frontier.pop()
+        node = next(frontier[-1], None)
+        if node is None:
+            frontier.pop()
+            continue
         if problem.goal_test(node.state):
             return node
-        frontier.extend(node.expand(problem))
+        frontier.append(node.iter_children(problem, reverse=True))
     return None
 
 
@@ -223,15 +255,19 @@ def depth_first_graph_search(problem):
     If two paths reach a state, only use the first one.
     """
     frontier = [(Node(problem.initial))]  # Stack
+    in_frontier = {frontier[0].state}  # States in frontier, for O(1) membership
 
     explored = set()
     while frontier:
         node = frontier.pop()
+        in_frontier.discard(node.state)
         if problem.goal_test(node.state):
             return node
         explored.add(node.state)
-        frontier.extend(child for child in node.expand(problem)
-                        if child.state not in explored and child not in frontier)
+        for child in node.expand(problem):
+            if child.state not in explored and child.state not in in_frontier:
+                frontier.append(child)
+                in_frontier.add(child.state)
     return None
 
 
@@ -245,15 +281,18 @@ def breadth_first_graph_search(problem):
     if problem.goal_test(node.state):
         return node
     frontier = deque([node])
+    in_frontier = {node.state}  # States in frontier, for O(1) membership
     explored = set()
     while frontier:
         node = frontier.popleft()
+        in_frontier.discard(node.state)
         explored.add(node.state)
         for child in node.expand(problem):
-            if child.state not in explored and child not in frontier:
+            if child.state not in explored and child.state not in in_frontier:
                 if problem.goal_test(child.state):
                     return child
                 frontier.append(child)
+                in_frontier.add(child.state)
     return None
 
 
@@ -302,7 +341,7 @@ def depth_limited_search(problem, limit=50):
             return 'cutoff'
         else:
             cutoff_occurred = False
-            for child in node.expand(problem):
+            for child in node.iter_children(problem):
                 result = recursive_dls(child, problem, limit - 1)
                 if result == 'cutoff':
                     cutoff_occurred = True
@@ -322,6 +361,91 @@ def iterative_deepening_search(problem):
             return result
 
 
+# ______________________________________________________________________________
+# In-place variants, for problems that implement apply and undo.
+# They change problem.initial itself, which ends as the goal state, and return
+# a goal Node whose ancestors hold the actions and path costs but no states.
+# Path costs are computed with the state already changed, as both state1 and
+# state2. Problems without apply and undo fall back to the copying versions.
+
+
+def in_place_solution(state, path):
+    """Build the goal Node from the [(action, path_cost)] of the path."""
+    node = Node(None)
+    for action, path_cost in path:
+        node = Node(None, node, action, path_cost)
+    node.state = state
+    return node
+
+
+def in_place_depth_first_tree_search(problem):
+    """depth_first_tree_search on a single state: each level of the stack
+    holds the actions still to try, and the trail holds the undo tokens of
+    the actions taken. Children are visited in the same order."""
+    if not problem.has_undo():
+        return depth_first_tree_search(problem)
+
+    state = problem.initial
+    if problem.goal_test(state):
+        return Node(state)
+    stack = [reversed(list(problem.actions(state)))]
+    trail, path = [], []
+    while stack:
+        action = next(stack[-1], None)
+        if action is None:
+            stack.pop()
+            if trail:
+                problem.undo(state, trail.pop())
+                path.pop()
+            continue
+        trail.append(problem.apply(state, action))
+        path.append((action, problem.path_cost(path[-1][1] if path else 0, state, action, state)))
+        if problem.goal_test(state):
+            return in_place_solution(state, path)
+        stack.append(reversed(list(problem.actions(state))))
+    return None
+
+
+def in_place_depth_limited_search(problem, limit=50):
+    """depth_limited_search on a single state."""
+    if not problem.has_undo():
+        return depth_limited_search(problem, limit)
+
+    state = problem.initial
+    path = []
+
+    def recursive_dls(path_cost, limit):
+        if problem.goal_test(state):
+            return True
+        elif limit == 0:
+            return 'cutoff'
+        else:
+            cutoff_occurred = False
+            for action in list(problem.actions(state)):
+                token = problem.apply(state, action)
+                path.append((action, problem.path_cost(path_cost, state, action, state)))
+                result = recursive_dls(path[-1][1], limit - 1)
+                if result is True:
+                    return True
+                path.pop()
+                problem.undo(state, token)
+                if result == 'cutoff':
+                    cutoff_occurred = True
+            return 'cutoff' if cutoff_occurred else None
+
+    # Body of in_place_depth_limited_search:
+    result = recursive_dls(0, limit)
+    return in_place_solution(state, path) if result is True else result
+
+
+def in_place_iterative_deepening_search(problem):
+    """iterative_deepening_search on a single state."""
+    for depth in range(sys.maxsize):
+        result = in_place_depth_limited_search(problem, depth)
+        if result != 'cutoff':
+            return result
+
+
 # ______________________________________________________________________________
 # Bidirectional Search
 # Pseudocode from https://webdocs.cs.ualberta.ca/%7Eholte/Publications/MM-AAAI2016.pdf
@@ -635,6 +759,148 @@ def recursive_best_first_search(problem, h=None):
     return result
 
 
+def ida_star_search(problem, h=None):
+    """Iterative deepening A*: a series of depth-first searches, each cut off
+    when f = g + h exceeds a bound, which starts at h(initial) and is raised to
+    the smallest f that went over it. Memory is linear in the solution depth.
+    States on the current path are not revisited, so states must be hashable."""
+    h = memoize(h or problem.h, 'h')
+
+    def bounded_dfs(node, bound, path):
+        f = node.path_cost + h(node)
+        if f > bound:
+            return None, f
+        if problem.goal_test(node.state):
+            return node, f
+        minimum = np.inf
+        for child in node.expand(problem):
+            if child.state in path:
+                continue
+            path.add(child.state)
+            result, t = bounded_dfs(child, bound, path)
+            path.discard(child.state)
+            if result is not None:
+                return result, t
+            minimum = min(minimum, t)
+        return None, minimum
+
+    node = Node(problem.initial)
+    bound = h(node)
+    while bound < np.inf:
+        result, bound = bounded_dfs(node, bound, {node.state})
+        if result is not None:
+            return result
+    return None
+
+
+def sma_star_search(problem, h=None, max_nodes=10000):
+    """Simplified memory-bounded A*: A* that keeps at most max_nodes nodes in
+    memory. When there is no room for new nodes, the worst leaf (highest f,
+    then shallowest) is forgotten; its parent remembers the leaf's f and
+    regenerates it when that f becomes the best in the tree. f values are
+    backed up from children to parents, and a node that cannot get a child
+    into memory is given f = infinity. Children that repeat a state of their
+    own path are skipped. Returns the best solution that fits in memory, or
+    None if there is none."""
+    h = memoize(h or problem.h, 'h')
+    counter = itertools.count()
+    opened, leaves = [], []
+
+    def on_path(state, node):
+        while node is not None:
+            if node.state == state:
+                return True
+            node = node.parent
+        return False
+
+    def open_f(node):
+        """f of the best node that expanding this one would produce."""
+        if node.children is None:
+            return node.f
+        return min(node.forgotten.values()) if node.forgotten else None
+
+    def push_open(node):
+        f = open_f(node)
+        if f is not None:
+            heapq.heappush(opened, (f, -node.depth, next(counter), node))
+
+    def push_leaf(node):
+        if node.parent is not None and not node.children:
+            heapq.heappush(leaves, (-node.f, node.depth, next(counter), node))
+
+    def backup(node):
+        """Propagate the lowest f of the children (kept or forgotten) upwards."""
+        while node is not None and node.children is not None:
+            values = [child.f for child in node.children] + list(node.forgotten.values())
+            f = min(values) if values else np.inf
+            if f == node.f:
+                break
+            node.f = f
+            push_leaf(node)
+            node = node.parent
+
+    def forget_worst(exclude):
+        """Remove the worst leaf other than exclude. Returns False if there is none."""
+        while leaves:
+            f, _, _, node = heapq.heappop(leaves)
+            if -f != node.f or not node.kept or node.children or node is exclude:
+                continue
+            parent = node.parent
+            parent.children.remove(node)
+            parent.forgotten[node.state] = node.f
+            node.kept = False
+            push_open(parent)
+            push_leaf(parent)
+            return True
+        return False
+
+    def new_node(node, f):
+        node.f, node.children, node.forgotten, node.kept = f, None, {}, True
+        return node
+
+    root = new_node(Node(problem.initial), 0)
+    root.f = h(root)
+    push_open(root)
+    used = 1
+    while opened:
+        f, _, _, best = heapq.heappop(opened)
+        if not best.kept or f != open_f(best):
+            continue
+        if f == np.inf:
+            return None
+        if best.children is None:
+            if problem.goal_test(best.state):
+                return best
+            children = [new_node(child, max(best.f, child.path_cost + h(child)))
+                        for child in best.expand(problem) if not on_path(child.state, best.parent)]
+            best.children = []
+        else:
+            children = [new_node(child, best.forgotten.pop(child.state))
+                        for child in best.expand(problem) if child.state in best.forgotten]
+        children.sort(key=lambda node: node.f)
+        while used + len(children) > max_nodes and forget_worst(best):
+            used -= 1
+        room = max(0, max_nodes - used)
+        for child in children[room:]:
+            best.forgotten[child.state] = child.f
+        children = children[:room]
+        used += len(children)
+        best.children.extend(children)
+        for child in children:
+            push_open(child)
+            push_leaf(child)
+        if not best.children:
+            # Nothing fits below this node
+            best.f = np.inf
+            best.forgotten.clear()
+            push_leaf(best)
+            backup(best.parent)
+        else:
+            backup(best)
+        push_open(best)
+    return None
+
+
 def hill_climbing(problem):
     """
     [Figure 4.2]
@@ -1522,7 +1788,7 @@ class InstrumentedProblem(Problem):
 
     def __init__(self, problem):
         self.problem = problem
-        self.succs = self.goal_tests = self.states = 0
+        self.succs = self.goal_tests = self.states = self.undos = 0
         self.found = None
 
     def actions(self, state):
@@ -1533,6 +1799,17 @@ class InstrumentedProblem(Problem):
         self.states += 1
         return self.problem.result(state, action)
 
+    def apply(self, state, action):
+        self.states += 1
+        return self.problem.apply(state, action)
+
+    def undo(self, state, token):
+        self.undos += 1
+        return self.problem.undo(state, token)
+
+    def has_undo(self):
+        return self.problem.has_undo()
+
     def goal_test(self, state):
         self.goal_tests += 1
         result = self.problem.goal_test(state)
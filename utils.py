@@ -724,10 +724,17 @@ class PriorityQueue:
     order) is returned first.
     If order is 'min', the item with minimum f(x) is
     returned first; if order is 'max', then it is the item with maximum f(x).
-    Also supports dict-like lookup."""
+    Also supports dict-like lookup.
+    Items must be hashable: each one is indexed in a dict, so membership and
+    lookup are O(1), and deletion just marks its heap entry as removed, so it
+    is O(1) too (the heap is rebuilt once removed entries outnumber live ones)."""
 
     def __init__(self, order='min', f=lambda x: x):
+        # Heap of [f(item), item, live] entries
         self.heap = []
+        # Maps each item to its live entries, in insertion order
+        self.entries = {}
+        self.size = 0
         if order == 'min':
             self.f = f
         elif order == 'max':  # now item with max f(x)
@@ -737,7 +744,10 @@ class PriorityQueue:
 
     def append(self, item):
         """Insert item at its correct position."""
-        heapq.heappush(self.heap, (self.f(item), item))
+        entry = [self.f(item), item, True]
+        heapq.heappush(self.heap, entry)
+        self.entries.setdefault(item, []).append(entry)
+        self.size += 1
 
     def extend(self, items):
         """Insert each item in items at its correct position."""
@@ -747,34 +757,50 @@ class PriorityQueue:
     def pop(self):
         """Pop and return the item (with min or max f(x) value)
         depending on the order."""
-        if self.heap:
-            return heapq.heappop(self.heap)[1]
-        else:
-            raise Exception('Trying to pop from empty PriorityQueue.')
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            if entry[2]:
+                self._forget(entry)
+                return entry[1]
+        raise Exception('Trying to pop from empty PriorityQueue.')
+
+    def _forget(self, entry):
+        """Remove a live entry from the index."""
+        item = entry[1]
+        live = self.entries[item]
+        for i, other in enumerate(live):
+            if other is entry:
+                del live[i]
+                break
+        if not live:
+            del self.entries[item]
+        self.size -= 1
 
     def __len__(self):
         """Return current capacity of PriorityQueue."""
-        return len(self.heap)
+        return self.size
 
     def __contains__(self, key):
         """Return True if the key is in PriorityQueue."""
-        return any([item == key for _, item in self.heap])
+        return key in self.entries
 
     def __getitem__(self, key):
         """Returns the first value associated with key in PriorityQueue.
         Raises KeyError if key is not present."""
-        for value, item in self.heap:
-            if item == key:
-                return value
-        raise KeyError(str(key) + " is not in the priority queue")
+        if key not in self.entries:
+            raise KeyError(str(key) + " is not in the priority queue")
+        return self.entries[key][0][0]
 
     def __delitem__(self, key):
         """Delete the first occurrence of key."""
-        try:
-            del self.heap[[item == key for _, item in self.heap].index(True)]
-        except ValueError:
+        if key not in self.entries:
             raise KeyError(str(key) + " is not in the priority queue")
-        heapq.heapify(self.heap)
+        entry = self.entries[key][0]
+        entry[2] = False
+        self._forget(entry)
+        if len(self.heap) > 2 * self.size + 32:
+            self.heap = [entry for entry in self.heap if entry[2]]
+            heapq.heapify(self.heap)
 
 
 # ______________________________________________________________________________